@@ -0,0 +1,160 @@
+import os
+import copy
+import time
+import shutil
+import threading
+from queue import Queue
+import torch
+from models.transformers import WEIGHTS_NAME
+from tools.common import logger
+
+
+def _to_cpu(obj):
+    '''
+    递归地把state_dict中的tensor拷贝到cpu上，保证后台线程写盘时不受训练继续更新参数的影响
+    '''
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, _to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+class CheckpointManager(object):
+    '''
+    checkpoint-{global_step} 的保存与清理：
+    1. 在训练线程中把model/optimizer/scheduler的state_dict快照到cpu
+    2. 在后台线程中写入临时目录，写完后rename成checkpoint-{global_step}
+    3. 只保留最近的keep_last个和dev f1最高的keep_best个checkpoint (都为0时保留全部)，最新的一个总是保留
+    Example:
+        >>> manager = CheckpointManager(args.output_dir, keep_last=2, keep_best=2)
+        >>> manager.update_metric(global_step, results['f1'])
+        >>> manager.save(global_step, model, tokenizer, optimizer, scheduler, args)
+        >>> manager.close()
+    '''
+    def __init__(self, output_dir, keep_last=0, keep_best=0, async_save=True):
+        self.output_dir = output_dir
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.async_save = async_save
+        self.saved_steps = []
+        self.scores = {}
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._thread = None
+        if async_save:
+            self._thread = threading.Thread(target=self._worker, name='checkpoint-writer', daemon=True)
+            self._thread.start()
+
+    def checkpoint_dir(self, global_step):
+        return os.path.join(self.output_dir, "checkpoint-{}".format(global_step))
+
+    def update_metric(self, global_step, score):
+        '''
+        记录global_step时的dev f1，用于保留最好的keep_best个checkpoint
+        '''
+        with self._lock:
+            self.scores[global_step] = score
+
+    def save(self, global_step, model, tokenizer, optimizer, scheduler, args, trainer_state=None):
+        '''
+        trainer_state: 断点续训需要的其他状态(sampler位置、随机数状态等)，保存为trainer_state.pt
+        '''
+        start = time.time()
+        model_to_save = model.module if hasattr(model, "module") else model  # Take care of distributed/parallel training
+        snapshot = {
+            'config': model_to_save.config,
+            'model': _to_cpu(model_to_save.state_dict()),
+            'optimizer': _to_cpu(optimizer.state_dict()),
+            # state_dict() returns references to the live state, which the training loop keeps updating
+            'scheduler': copy.deepcopy(scheduler.state_dict()),
+            'args': args,
+            'trainer_state': trainer_state,
+        }
+        snapshot_time = time.time() - start
+        if self.async_save:
+            self._queue.put((global_step, tokenizer, snapshot, snapshot_time))
+        else:
+            self._write(global_step, tokenizer, snapshot, snapshot_time)
+
+    def wait(self):
+        '''
+        阻塞直到所有已提交的checkpoint写盘完成
+        '''
+        if self.async_save:
+            self._queue.join()
+
+    def close(self):
+        self.wait()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(*job)
+            except Exception:
+                logger.exception("Failed to save checkpoint-%s", job[0])
+            finally:
+                self._queue.task_done()
+
+    def _write(self, global_step, tokenizer, snapshot, snapshot_time):
+        start = time.time()
+        output_dir = self.checkpoint_dir(global_step)
+        # 以.开头，不会被--eval_all_checkpoints的glob匹配到
+        tmp_dir = os.path.join(self.output_dir, ".tmp-checkpoint-{}".format(global_step))
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        snapshot['config'].save_pretrained(tmp_dir)
+        torch.save(snapshot['model'], os.path.join(tmp_dir, WEIGHTS_NAME))
+        tokenizer.save_vocabulary(tmp_dir)
+        torch.save(snapshot['args'], os.path.join(tmp_dir, "training_args.bin"))
+        torch.save(snapshot['optimizer'], os.path.join(tmp_dir, "optimizer.pt"))
+        torch.save(snapshot['scheduler'], os.path.join(tmp_dir, "scheduler.pt"))
+        if snapshot['trainer_state'] is not None:
+            torch.save(snapshot['trainer_state'], os.path.join(tmp_dir, "trainer_state.pt"))
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.rename(tmp_dir, output_dir)
+        write_time = time.time() - start
+        with self._lock:
+            if global_step not in self.saved_steps:
+                self.saved_steps.append(global_step)
+        self._apply_retention()
+        disk_usage = sum(_dir_size(self.checkpoint_dir(step)) for step in self.saved_steps)
+        logger.info("Saving model checkpoint to %s (snapshot %.2fs in training loop, write %.2fs in background, "
+                    "%d checkpoints using %.1f MB)", output_dir, snapshot_time, write_time,
+                    len(self.saved_steps), disk_usage / 1024 ** 2)
+
+    def _apply_retention(self):
+        if self.keep_last <= 0 and self.keep_best <= 0:
+            return
+        with self._lock:
+            keep = set(self.saved_steps[-self.keep_last:]) if self.keep_last > 0 else set()
+            # the newest checkpoint is kept for resuming, even when it has no dev f1 (yet)
+            keep.update(self.saved_steps[-1:])
+            if self.keep_best > 0:
+                scored = [step for step in self.saved_steps if step in self.scores]
+                scored.sort(key=lambda step: self.scores[step], reverse=True)
+                keep.update(scored[:self.keep_best])
+            removed = [step for step in self.saved_steps if step not in keep]
+            self.saved_steps = [step for step in self.saved_steps if step in keep]
+        for step in removed:
+            shutil.rmtree(self.checkpoint_dir(step), ignore_errors=True)
+            logger.info("Deleting checkpoint-%s (retention policy)", step)
@@ -0,0 +1,58 @@
+import numpy as np
+from tools.common import logger
+
+
+class EarlyStopping(object):
+    '''
+    当监控的指标在patience次评估内都没有提升时，停止训练
+    Args:
+        min_delta: 指标的变化小于min_delta时不算提升
+        patience: 没有提升的评估次数达到patience后停止训练
+        mode: one of {min, max}. min: 指标越小越好(loss)，max: 指标越大越好(f1)
+        baseline: 指标需要超过的基线值
+    Example:
+        >>> es = EarlyStopping(monitor='f1', mode='max', patience=3)
+        >>> for step, batch in enumerate(train_data):
+        >>>     ...
+        >>>     results = evaluate(...)
+        >>>     es.epoch_step(results['f1'])
+        >>>     if es.stop_training:
+        >>>         break
+    '''
+    def __init__(self, min_delta=0, patience=10, verbose=1, mode='min', monitor='loss', baseline=None):
+        self.baseline = baseline
+        self.patience = patience
+        self.verbose = verbose
+        self.min_delta = min_delta
+        self.monitor = monitor
+        if mode not in ['min', 'max']:
+            raise ValueError('EarlyStopping mode %s is unknown!' % mode)
+        if mode == 'min':
+            self.monitor_op = np.less
+        else:
+            self.monitor_op = np.greater
+        # 统一成 monitor_op(current - min_delta, best)
+        if mode == 'min':
+            self.min_delta *= -1
+        self.reset()
+
+    def reset(self):
+        # Allow instances to be re-used
+        self.wait = 0
+        self.stop_training = False
+        if self.baseline is not None:
+            self.best = self.baseline
+        else:
+            self.best = np.Inf if self.monitor_op == np.less else -np.Inf
+
+    def epoch_step(self, current):
+        if self.monitor_op(current - self.min_delta, self.best):
+            self.best = current
+            self.wait = 0
+        else:
+            self.wait += 1
+            if self.wait >= self.patience:
+                if self.verbose > 0:
+                    logger.info(f"{self.patience} evaluations with no improvement of {self.monitor} "
+                                f"(best {self.best:.5f}), early stopping")
+                self.stop_training = True
@@ -0,0 +1,41 @@
+import json
+import time
+from pathlib import Path
+
+
+class MetricsLogger(object):
+    '''
+    把每个logging窗口的指标以一行json追加写入文件(jsonl)，断点续训时接着写，方便对比不同的训练
+    Example:
+        >>> metrics_logger = MetricsLogger(os.path.join(args.output_dir, "train_metrics.jsonl"))
+        >>> metrics_logger.log({'global_step': global_step, 'loss': loss, 'samples_per_sec': 120.5})
+        >>> metrics_logger.close()
+    '''
+    def __init__(self, file_path):
+        if not isinstance(file_path, Path):
+            file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_path = file_path
+        self.writer = open(str(file_path), 'a')
+
+    def log(self, record):
+        record = dict(record, time=time.time())
+        self.writer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.writer.flush()
+
+    def close(self):
+        if not self.writer.closed:
+            self.writer.close()
+
+
+def load_metrics(file_path):
+    '''
+    读取MetricsLogger写入的jsonl文件，返回记录的list
+    '''
+    records = []
+    with open(str(file_path), 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
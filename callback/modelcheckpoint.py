@@ -1,7 +1,7 @@
 from pathlib import Path
 import numpy as np
 import torch
-from ..tools.common import logger
+from tools.common import logger
 
 class ModelCheckpoint(object):
     '''
@@ -70,7 +70,7 @@ class ModelCheckpoint(object):
         适合bert类型模型，适合pytorch_transformer模块
         :param state:
         :param current:
-        :return:
+        :return: save_best_only时返回current是否是新的最优值
         '''
         model_to_save = state['model']
         if self.save_best_only:
@@ -84,6 +84,8 @@ class ModelCheckpoint(object):
                     f.write(model_to_save.config.to_json_string())
                 state.pop("model")
                 torch.save(state,self.base_path / 'checkpoint_info.bin')
+                return True
+            return False
         else:
             if state['epoch'] % self.epoch_freq == 0:
                 save_path = self.base_path / f"checkpoint-epoch-{state['epoch']}"
@@ -11,11 +11,14 @@ class AdamW(Optimizer):
         eps (float): Adams epsilon. Default: 1e-6
         weight_decay (float): Weight decay. Default: 0.0
         correct_bias (bool): can be set to False to avoid correcting bias in Adam (e.g. like in Bert TF repository). Default True.
+        foreach (bool): update all the parameters of a group with multi-tensor `torch._foreach_*` kernels
+            instead of a python loop over the parameters. Default False.
     Example:
         >>> model = LSTM()
         >>> optimizer = AdamW(model.parameters(), lr=1e-3, weight_decay=1e-5)
     """
-    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-6, weight_decay=0.0, correct_bias=True):
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-6, weight_decay=0.0, correct_bias=True,
+                 foreach=False):
         if lr < 0.0:
             raise ValueError("Invalid learning rate: {} - should be >= 0.0".format(lr))
         if not 0.0 <= betas[0] < 1.0:
@@ -26,6 +29,7 @@ class AdamW(Optimizer):
             raise ValueError("Invalid epsilon value: {} - should be >= 0.0".format(eps))
         defaults = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay,
                         correct_bias=correct_bias)
+        self.foreach = foreach
         super(AdamW, self).__init__(params, defaults)
 
     def step(self, closure=None):
@@ -40,6 +44,9 @@ class AdamW(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            if self.foreach:
+                self._foreach_group_step(group)
+                continue
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -88,3 +95,42 @@ class AdamW(Optimizer):
                     p.data.add_(-group['lr'] * group['weight_decay'], p.data)
 
         return loss
+
+    def _foreach_group_step(self, group):
+        """Same update as the loop in `step`, batched over the parameters of `group` that share a step count."""
+        beta1, beta2 = group['betas']
+        buckets = {}
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            if p.grad.is_sparse:
+                raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
+            state = self.state[p]
+            if len(state) == 0:
+                state['step'] = 0
+                state['exp_avg'] = torch.zeros_like(p.data)
+                state['exp_avg_sq'] = torch.zeros_like(p.data)
+            state['step'] += 1
+            bucket = buckets.setdefault(state['step'], ([], [], [], []))
+            bucket[0].append(p.data)
+            bucket[1].append(p.grad.data)
+            bucket[2].append(state['exp_avg'])
+            bucket[3].append(state['exp_avg_sq'])
+
+        for step, (params, grads, exp_avgs, exp_avg_sqs) in buckets.items():
+            torch._foreach_mul_(exp_avgs, beta1)
+            torch._foreach_add_(exp_avgs, grads, alpha=1.0 - beta1)
+            torch._foreach_mul_(exp_avg_sqs, beta2)
+            torch._foreach_addcmul_(exp_avg_sqs, grads, grads, 1.0 - beta2)
+            denoms = torch._foreach_sqrt(exp_avg_sqs)
+            torch._foreach_add_(denoms, group['eps'])
+
+            step_size = group['lr']
+            if group['correct_bias']:
+                bias_correction1 = 1.0 - beta1 ** step
+                bias_correction2 = 1.0 - beta2 ** step
+                step_size = step_size * math.sqrt(bias_correction2) / bias_correction1
+            torch._foreach_addcdiv_(params, exp_avgs, denoms, -step_size)
+            # decoupled weight decay, see `step`
+            if group['weight_decay'] > 0.0:
+                torch._foreach_add_(params, params, alpha=-group['lr'] * group['weight_decay'])
@@ -0,0 +1,141 @@
+import torch
+import math
+from torch.optim.optimizer import Optimizer
+
+
+def _signed_code():
+    # odd power keeps the sign and spends most of the 256 codes on small magnitudes
+    return torch.linspace(-1.0, 1.0, 256) ** 3
+
+
+def _unsigned_code():
+    return torch.linspace(0.0, 1.0, 256) ** 4
+
+
+class AdamW8bit(Optimizer):
+    """ AdamW (same update as `AdamW`) whose moments are stored in 8 bits with blockwise absmax scaling.
+
+    Every moment tensor is split in blocks of `block_size` values, each block keeps one fp32 absmax and
+    one uint8 code per value (a non-linear code book, so small values keep their relative precision).
+    This takes ~2 bytes per parameter instead of 8 for the two fp32 moments. Tensors smaller than
+    `min_8bit_size` keep fp32 moments. Pure PyTorch, runs on cpu and cuda.
+
+    Parameters:
+        lr (float): learning rate. Default 1e-3.
+        betas (tuple of 2 floats): Adams beta parameters (b1, b2). Default: (0.9, 0.999)
+        eps (float): Adams epsilon. Default: 1e-6
+        weight_decay (float): Weight decay. Default: 0.0
+        correct_bias (bool): can be set to False to avoid correcting bias in Adam (e.g. like in Bert TF repository). Default True.
+        block_size (int): number of values sharing one absmax scale. Default 2048.
+        min_8bit_size (int): tensors with fewer elements keep fp32 moments. Default 4096.
+    Example:
+        >>> model = LSTM()
+        >>> optimizer = AdamW8bit(model.parameters(), lr=1e-3, weight_decay=1e-5)
+    """
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-6, weight_decay=0.0, correct_bias=True,
+                 block_size=2048, min_8bit_size=4096):
+        if lr < 0.0:
+            raise ValueError("Invalid learning rate: {} - should be >= 0.0".format(lr))
+        if not 0.0 <= betas[0] < 1.0:
+            raise ValueError("Invalid beta parameter: {} - should be in [0.0, 1.0[".format(betas[0]))
+        if not 0.0 <= betas[1]  < 1.0:
+            raise ValueError("Invalid beta parameter: {} - should be in [0.0, 1.0[".format(betas[1]))
+        if not 0.0 <= eps:
+            raise ValueError("Invalid epsilon value: {} - should be >= 0.0".format(eps))
+        if block_size <= 0:
+            raise ValueError("Invalid block size: {} - should be > 0".format(block_size))
+        defaults = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay,
+                        correct_bias=correct_bias)
+        self.block_size = block_size
+        self.min_8bit_size = min_8bit_size
+        self._codes = {}
+        super(AdamW8bit, self).__init__(params, defaults)
+
+    def _code(self, name, device):
+        key = (name, device)
+        if key not in self._codes:
+            code = _signed_code() if name == 'signed' else _unsigned_code()
+            code = code.to(device)
+            # midpoints between neighbouring codes, used to round to the nearest code
+            self._codes[key] = (code, (code[1:] + code[:-1]) / 2)
+        return self._codes[key]
+
+    def _quantize(self, x, name):
+        code, boundaries = self._code(name, x.device)
+        flat = x.reshape(-1)
+        padding = (-flat.numel()) % self.block_size
+        if padding:
+            flat = torch.cat([flat, flat.new_zeros(padding)])
+        blocks = flat.view(-1, self.block_size)
+        absmax = blocks.abs().max(dim=1, keepdim=True)[0].clamp_(min=1e-30)
+        quantized = torch.bucketize(blocks / absmax, boundaries).to(torch.uint8)
+        return quantized, absmax
+
+    def _dequantize(self, quantized, absmax, name, like):
+        code, _ = self._code(name, quantized.device)
+        values = code[quantized.long()] * absmax
+        return values.view(-1)[:like.numel()].view_as(like)
+
+    def step(self, closure=None):
+        """Performs a single optimization step.
+
+        Arguments:
+            closure (callable, optional): A closure that reevaluates the model
+                and returns the loss.
+        """
+        loss = None
+        if closure is not None:
+            loss = closure()
+
+        for group in self.param_groups:
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+                grad = p.grad.data.float()
+                if grad.is_sparse:
+                    raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
+
+                state = self.state[p]
+                quantized = p.data.numel() >= self.min_8bit_size
+
+                # State initialization
+                if len(state) == 0:
+                    state['step'] = 0
+                    zeros = torch.zeros_like(p.data, dtype=torch.float32)
+                    if quantized:
+                        state['exp_avg_q'], state['exp_avg_absmax'] = self._quantize(zeros, 'signed')
+                        state['exp_avg_sq_q'], state['exp_avg_sq_absmax'] = self._quantize(zeros, 'unsigned')
+                    else:
+                        state['exp_avg'] = zeros
+                        state['exp_avg_sq'] = zeros.clone()
+
+                if quantized:
+                    exp_avg = self._dequantize(state['exp_avg_q'], state['exp_avg_absmax'], 'signed', grad)
+                    exp_avg_sq = self._dequantize(state['exp_avg_sq_q'], state['exp_avg_sq_absmax'], 'unsigned', grad)
+                else:
+                    exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+                beta1, beta2 = group['betas']
+
+                state['step'] += 1
+
+                # Decay the first and second moment running average coefficient
+                exp_avg.mul_(beta1).add_(grad, alpha=1.0 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1.0 - beta2)
+                denom = exp_avg_sq.sqrt().add_(group['eps'])
+
+                step_size = group['lr']
+                if group['correct_bias']:  # No bias correction for Bert
+                    bias_correction1 = 1.0 - beta1 ** state['step']
+                    bias_correction2 = 1.0 - beta2 ** state['step']
+                    step_size = step_size * math.sqrt(bias_correction2) / bias_correction1
+
+                p.data.addcdiv_(exp_avg.to(p.data.dtype), denom.to(p.data.dtype), value=-step_size)
+                # Add weight decay at the end (fixed version), see `AdamW`
+                if group['weight_decay'] > 0.0:
+                    p.data.add_(p.data, alpha=-group['lr'] * group['weight_decay'])
+
+                if quantized:
+                    state['exp_avg_q'], state['exp_avg_absmax'] = self._quantize(exp_avg, 'signed')
+                    state['exp_avg_sq_q'], state['exp_avg_sq_absmax'] = self._quantize(exp_avg_sq, 'unsigned')
+
+        return loss
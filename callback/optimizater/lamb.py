@@ -16,6 +16,9 @@ class Lamb(Optimizer):
         weight_decay (float, optional): weight decay (L2 penalty) (default: 0)
         adam (bool, optional): always use trust ratio = 1, which turns this into
             Adam. Useful for comparison purposes.
+        foreach (bool, optional): update all the parameters of a group with
+            multi-tensor `torch._foreach_*` kernels and compute the trust ratios
+            on the device (default: False)
     .. _Large Batch Optimization for Deep Learning: Training BERT in 76 minutes:
         https://arxiv.org/abs/1904.00962
     Example:
@@ -24,7 +27,7 @@ class Lamb(Optimizer):
     """
 
     def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-6,
-                 weight_decay=0, adam=False):
+                 weight_decay=0, adam=False, foreach=False):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
         if not 0.0 <= eps:
@@ -36,6 +39,7 @@ class Lamb(Optimizer):
         defaults = dict(lr=lr, betas=betas, eps=eps,
                         weight_decay=weight_decay)
         self.adam = adam
+        self.foreach = foreach
         super(Lamb, self).__init__(params, defaults)
 
     def step(self, closure=None):
@@ -49,6 +53,9 @@ class Lamb(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            if self.foreach:
+                self._foreach_group_step(group)
+                continue
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -102,4 +109,50 @@ class Lamb(Optimizer):
 
                 p.data.add_(-step_size * trust_ratio, adam_step)
 
-        return loss
\ No newline at end of file
+        return loss
+
+    def _foreach_group_step(self, group):
+        """Same update as the loop in `step`, batched over all the parameters of `group`."""
+        beta1, beta2 = group['betas']
+        states, params, grads, exp_avgs, exp_avg_sqs = [], [], [], [], []
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            if p.grad.is_sparse:
+                raise RuntimeError('Lamb does not support sparse gradients, consider SparseAdam instad.')
+            state = self.state[p]
+            if len(state) == 0:
+                state['step'] = 0
+                state['exp_avg'] = torch.zeros_like(p.data)
+                state['exp_avg_sq'] = torch.zeros_like(p.data)
+            state['step'] += 1
+            states.append(state)
+            params.append(p.data)
+            grads.append(p.grad.data)
+            exp_avgs.append(state['exp_avg'])
+            exp_avg_sqs.append(state['exp_avg_sq'])
+        if not params:
+            return
+
+        torch._foreach_mul_(exp_avgs, beta1)
+        torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+        torch._foreach_mul_(exp_avg_sqs, beta2)
+        torch._foreach_addcmul_(exp_avg_sqs, grads, grads, 1 - beta2)
+
+        weight_norms = torch.stack(torch._foreach_norm(params)).clamp(0, 10)
+        adam_steps = torch._foreach_sqrt(exp_avg_sqs)
+        torch._foreach_add_(adam_steps, group['eps'])
+        adam_steps = torch._foreach_div(exp_avgs, adam_steps)
+        if group['weight_decay'] != 0:
+            torch._foreach_add_(adam_steps, params, alpha=group['weight_decay'])
+        adam_norms = torch.stack(torch._foreach_norm(adam_steps))
+        # trust ratios stay on the device, no host sync per parameter
+        trust_ratios = torch.where((weight_norms == 0) | (adam_norms == 0), torch.ones_like(weight_norms),
+                                   weight_norms / adam_norms)
+        for state, weight_norm, adam_norm, trust_ratio in zip(states, weight_norms, adam_norms, trust_ratios):
+            state['weight_norm'] = weight_norm
+            state['adam_norm'] = adam_norm
+            state['trust_ratio'] = trust_ratio
+        if not self.adam:
+            torch._foreach_mul_(adam_steps, list(trust_ratios.unbind()))
+        torch._foreach_add_(params, adam_steps, alpha=-group['lr'])
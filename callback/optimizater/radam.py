@@ -9,14 +9,16 @@ class RAdam(Optimizer):
         betas (Tuple[float, float], optional): coefficients used for computing running averages of gradient and its square (default: (0.9, 0.999))
         eps (float, optional): term added to the denominator to improve numerical stability (default: 1e-8)
         weight_decay (float, optional): weight decay (L2 penalty) (default: 0)
+        foreach (bool, optional): update all the parameters of a group with multi-tensor `torch._foreach_*` kernels (default: False)
     Example:
         >>> model = ResNet()
         >>> optimizer = RAdam(model.parameters(), lr=0.001)
     """
 
-    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0):
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0, foreach=False):
         defaults = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay)
         self.buffer = [[None, None, None] for ind in range(10)]
+        self.foreach = foreach
         super(RAdam, self).__init__(params, defaults)
 
     def __setstate__(self, state):
@@ -29,6 +31,9 @@ class RAdam(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            if self.foreach:
+                self._foreach_group_step(group)
+                continue
 
             for p in group['params']:
                 if p.grad is None:
@@ -85,4 +90,67 @@ class RAdam(Optimizer):
 
                 p.data.copy_(p_data_fp32)
 
-        return loss
\ No newline at end of file
+        return loss
+
+    def _rectification(self, step, beta1, beta2):
+        buffered = self.buffer[int(step % 10)]
+        if step == buffered[0]:
+            return buffered[1], buffered[2]
+        buffered[0] = step
+        beta2_t = beta2 ** step
+        N_sma_max = 2 / (1 - beta2) - 1
+        N_sma = N_sma_max - 2 * step * beta2_t / (1 - beta2_t)
+        buffered[1] = N_sma
+        # more conservative since it's an approximated value
+        if N_sma >= 5:
+            step_size = math.sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** step)
+        else:
+            step_size = 1.0 / (1 - beta1 ** step)
+        buffered[2] = step_size
+        return N_sma, step_size
+
+    def _foreach_group_step(self, group):
+        """Same update as the loop in `step`, batched over the parameters of `group` that share a step count."""
+        beta1, beta2 = group['betas']
+        buckets = {}
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            if p.grad.is_sparse:
+                raise RuntimeError('RAdam does not support sparse gradients')
+            p_data_fp32 = p.data.float()
+            state = self.state[p]
+            if len(state) == 0:
+                state['step'] = 0
+                state['exp_avg'] = torch.zeros_like(p_data_fp32)
+                state['exp_avg_sq'] = torch.zeros_like(p_data_fp32)
+            else:
+                state['exp_avg'] = state['exp_avg'].type_as(p_data_fp32)
+                state['exp_avg_sq'] = state['exp_avg_sq'].type_as(p_data_fp32)
+            state['step'] += 1
+            bucket = buckets.setdefault(state['step'], ([], [], [], [], []))
+            bucket[0].append(p)
+            bucket[1].append(p_data_fp32)
+            bucket[2].append(p.grad.data.float())
+            bucket[3].append(state['exp_avg'])
+            bucket[4].append(state['exp_avg_sq'])
+
+        for step, (ps, params, grads, exp_avgs, exp_avg_sqs) in buckets.items():
+            torch._foreach_mul_(exp_avg_sqs, beta2)
+            torch._foreach_addcmul_(exp_avg_sqs, grads, grads, 1 - beta2)
+            torch._foreach_mul_(exp_avgs, beta1)
+            torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+
+            N_sma, step_size = self._rectification(step, beta1, beta2)
+            if group['weight_decay'] != 0:
+                torch._foreach_add_(params, params, alpha=-group['weight_decay'] * group['lr'])
+            if N_sma >= 5:
+                denoms = torch._foreach_sqrt(exp_avg_sqs)
+                torch._foreach_add_(denoms, group['eps'])
+                torch._foreach_addcdiv_(params, exp_avgs, denoms, -step_size * group['lr'])
+            else:
+                torch._foreach_add_(params, exp_avgs, alpha=-step_size * group['lr'])
+            # fp16 parameters were updated through an fp32 copy
+            for p, p_data_fp32 in zip(ps, params):
+                if p.data.data_ptr() != p_data_fp32.data_ptr():
+                    p.data.copy_(p_data_fp32)
@@ -1,4 +1,8 @@
 import time
+import numpy as np
+from tools.common import DeviceAverageMeter
+
+
 class ProgressBar(object):
     '''
     custom progress bar
@@ -6,14 +10,23 @@ class ProgressBar(object):
         >>> pbar = ProgressBar(n_total=30,desc='training')
         >>> step = 2
         >>> pbar(step=step)
+    refresh_steps: only redraw the bar every X steps (and on the last one), callers can check
+    `is_refresh_step` to avoid computing the info (e.g. `loss.item()`) on the other steps
     '''
-    def __init__(self, n_total,width=30,desc = 'Training'):
+    def __init__(self, n_total,width=30,desc = 'Training', refresh_steps=1):
         self.width = width
         self.n_total = n_total
         self.start_time = time.time()
         self.desc = desc
+        self.refresh_steps = max(1, refresh_steps)
+
+    def is_refresh_step(self, step):
+        current = step + 1
+        return current % self.refresh_steps == 0 or current >= self.n_total
 
     def __call__(self, step, info={}):
+        if not self.is_refresh_step(step):
+            return
         now = time.time()
         current = step + 1
         recv_per = current / self.n_total
@@ -56,3 +69,69 @@ class ProgressBar(object):
             print(show_info, end='')
         else:
             print(show_bar, end='')
+
+
+class ThroughputMeter(object):
+    '''
+    throughput and latency of the steps of one logging window
+    the step time is measured on the host between two `update` calls, a single value does not wait for the
+    device but the window (which ends with a synchronising `loss.item()`) adds up to the real time.
+    the number of real tokens is summed on the device and only read by `summary`
+    Example:
+        >>> meter = ThroughputMeter()
+        >>> for step, batch in enumerate(train_data):
+        >>>     ...
+        >>>     meter.update(input_lens=batch[3], padded_tokens=batch[0].numel())
+        >>>     if step % logging_steps == 0:
+        >>>         logger.info(meter.summary())
+        >>>         meter.reset()
+        >>>     meter.pause()
+        >>>     save_checkpoint()  # not counted in the window
+        >>>     meter.resume()
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.time()
+        self.last_time = self.start_time
+        self.pause_time = None
+        self.step_times = []
+        self.samples = 0
+        self.padded_tokens = 0
+        self.tokens = DeviceAverageMeter()
+
+    def update(self, input_lens, padded_tokens):
+        now = time.time()
+        self.step_times.append(now - self.last_time)
+        self.last_time = now
+        self.samples += input_lens.size(0)
+        self.padded_tokens += padded_tokens
+        self.tokens.update(input_lens.sum())
+
+    def pause(self):
+        self.pause_time = time.time()
+
+    def resume(self):
+        # the window is shifted by the paused time, which is then neither part of a step nor of the window
+        paused = time.time() - self.pause_time
+        self.start_time += paused
+        self.last_time += paused
+        self.pause_time = None
+
+    @property
+    def samples_per_sec(self):
+        return self.samples / max(time.time() - self.start_time, 1e-6)
+
+    def summary(self):
+        elapsed = max(self.last_time - self.start_time, 1e-6)
+        tokens = self.tokens.sum
+        step_times = np.array(self.step_times or [0.0]) * 1e3
+        return {
+            'samples_per_sec': self.samples / elapsed,
+            'tokens_per_sec': tokens / elapsed,
+            'padding_ratio': 1.0 - tokens / max(self.padded_tokens, 1),
+            'step_time_p50_ms': float(np.percentile(step_times, 50)),
+            'step_time_p90_ms': float(np.percentile(step_times, 90)),
+            'step_time_p99_ms': float(np.percentile(step_times, 99)),
+        }
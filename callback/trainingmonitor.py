@@ -2,8 +2,9 @@
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
-from ..tools.common import load_json
-from ..tools.common import save_json
+from tools.common import load_json
+from tools.common import save_json
+from callback.metricslogger import load_metrics
 plt.switch_backend('agg')
 
 class TrainingMonitor():
@@ -67,3 +68,31 @@ class TrainingMonitor():
                 plt.title(f"Training {key} [Epoch {len(self.H[key])}]")
                 plt.savefig(str(self.paths[key]))
                 plt.close()
+
+    def plot_metrics(self, metrics_file, keys=None, x_key='global_step'):
+        '''
+        画出MetricsLogger记录的指标(吞吐量、step耗时、显存、学习率等)随global_step的变化，每个指标一张图
+        :param metrics_file: MetricsLogger写入的jsonl文件
+        :param keys: 需要画的指标，默认为所有数值型的指标
+        '''
+        records = [record for record in load_metrics(metrics_file) if x_key in record]
+        if keys is None:
+            keys = []
+            for record in records:
+                for key, value in record.items():
+                    if key not in keys and key not in (x_key, 'epoch', 'time') and isinstance(value, (int, float)):
+                        keys.append(key)
+        for key in keys:
+            points = [(record[x_key], record[key]) for record in records if record.get(key) is not None]
+            if not points:
+                continue
+            N, values = zip(*points)
+            plt.style.use("ggplot")
+            plt.figure()
+            plt.plot(N, values, label=key)
+            plt.legend()
+            plt.xlabel(x_key)
+            plt.ylabel(key)
+            plt.title(f"Training {key} [Step {N[-1]}]")
+            plt.savefig(str(self.file_dir / (self.arch + f'_{key.upper()}')))
+            plt.close()
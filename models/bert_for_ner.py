@@ -6,6 +6,7 @@ from .transformers.modeling_bert import BertPreTrainedModel
 from .transformers.modeling_bert import BertModel, BertLayer
 from .layers.linears import PoolerEndLogits, PoolerStartLogits
 from torch.nn import CrossEntropyLoss
+from torch.autograd.profiler import record_function
 from losses.focal_loss import FocalLoss
 from losses.label_smoothing import LabelSmoothingCrossEntropy
 
@@ -55,13 +56,16 @@ class BertCrfForNer(BertPreTrainedModel):
         self.init_weights()
 
     def forward(self, input_ids, token_type_ids=None, attention_mask=None, input_span_mask=None, labels=None,input_lens=None):
-        outputs =self.bert(input_ids = input_ids,attention_mask=attention_mask,token_type_ids=token_type_ids)
+        with record_function("bert_encoder"):
+            outputs =self.bert(input_ids = input_ids,attention_mask=attention_mask,token_type_ids=token_type_ids)
         sequence_output = outputs[0]
-        sequence_output = self.dropout(sequence_output)
-        logits = self.classifier(sequence_output)
+        with record_function("classifier"):
+            sequence_output = self.dropout(sequence_output)
+            logits = self.classifier(sequence_output)
         outputs = (logits,)
         if labels is not None:
-            loss = self.crf(emissions = logits, tags=labels, mask=attention_mask)
+            with record_function("crf_loss"):
+                loss = self.crf(emissions = logits, tags=labels, mask=attention_mask)
             outputs =(-1*loss,)+outputs
         return outputs # (loss), scores
 
@@ -76,22 +80,26 @@ class BertCrfForNerWithSyn(BertPreTrainedModel):
         self.init_weights()
 
     def forward(self, input_ids, token_type_ids=None, attention_mask=None, input_span_mask=None, labels=None,input_lens=None):
-        outputs =self.bert(input_ids = input_ids,attention_mask=attention_mask,token_type_ids=token_type_ids)
+        with record_function("bert_encoder"):
+            outputs =self.bert(input_ids = input_ids,attention_mask=attention_mask,token_type_ids=token_type_ids)
         sequence_output = outputs[0]
 
-        extended_span_attention_mask = input_span_mask.unsqueeze(1)
-        extended_span_attention_mask = extended_span_attention_mask.to(
-            dtype=next(self.parameters()).dtype)  # fp16 compatibility
-        extended_span_attention_mask = (1.0 - extended_span_attention_mask) * -10000.0
-        
-        # cosine: samply call the BertLayer, this layer can help us do somethink like self-attention, the same as Transformer
-        sequence_output = self.span_layer(sequence_output, extended_span_attention_mask)[0]
+        with record_function("span_layer"):
+            extended_span_attention_mask = input_span_mask.unsqueeze(1)
+            extended_span_attention_mask = extended_span_attention_mask.to(
+                dtype=next(self.parameters()).dtype)  # fp16 compatibility
+            extended_span_attention_mask = (1.0 - extended_span_attention_mask) * -10000.0
 
-        sequence_output = self.dropout(sequence_output)
-        logits = self.classifier(sequence_output)
+            # cosine: samply call the BertLayer, this layer can help us do somethink like self-attention, the same as Transformer
+            sequence_output = self.span_layer(sequence_output, extended_span_attention_mask)[0]
+
+        with record_function("classifier"):
+            sequence_output = self.dropout(sequence_output)
+            logits = self.classifier(sequence_output)
         outputs = (logits,)
         if labels is not None:
-            loss = self.crf(emissions = logits, tags=labels, mask=attention_mask)
+            with record_function("crf_loss"):
+                loss = self.crf(emissions = logits, tags=labels, mask=attention_mask)
             outputs =(-1*loss,)+outputs
         return outputs # (loss), scores
 
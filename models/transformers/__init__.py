@@ -12,84 +12,120 @@ try:
 except:
     pass
 
+import os
 import logging
+import importlib
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 # Files and general utilities
 from .file_utils import (TRANSFORMERS_CACHE, PYTORCH_TRANSFORMERS_CACHE, PYTORCH_PRETRAINED_BERT_CACHE,
                          cached_path, add_start_docstrings, add_end_docstrings,
-                         WEIGHTS_NAME, TF2_WEIGHTS_NAME, TF_WEIGHTS_NAME, CONFIG_NAME,
-                         is_tf_available, is_torch_available)
-
-# Tokenizers
-from .tokenization_utils import (PreTrainedTokenizer)
-from .tokenization_auto import AutoTokenizer
-from .tokenization_bert import BertTokenizer, BasicTokenizer, WordpieceTokenizer
-from .tokenization_openai import OpenAIGPTTokenizer
-from .tokenization_transfo_xl import (TransfoXLTokenizer, TransfoXLCorpus)
-from .tokenization_gpt2 import GPT2Tokenizer
-from .tokenization_ctrl import CTRLTokenizer
-from .tokenization_xlnet import XLNetTokenizer, SPIECE_UNDERLINE
-from .tokenization_xlm import XLMTokenizer
-from .tokenization_roberta import RobertaTokenizer
-from .tokenization_distilbert import DistilBertTokenizer
-from .tokenization_albert import FullTokenizer
-
-# Configurations
-from .configuration_utils import PretrainedConfig
-from .configuration_auto import AutoConfig
-from .configuration_bert import BertConfig, BERT_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_openai import OpenAIGPTConfig, OPENAI_GPT_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_transfo_xl import TransfoXLConfig, TRANSFO_XL_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_gpt2 import GPT2Config, GPT2_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_ctrl import CTRLConfig, CTRL_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_xlnet import XLNetConfig, XLNET_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_ctrl import CTRLConfig, CTRL_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_xlm import XLMConfig, XLM_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_roberta import RobertaConfig, ROBERTA_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_distilbert import DistilBertConfig, DISTILBERT_PRETRAINED_CONFIG_ARCHIVE_MAP
-from .configuration_albert import AlbertConfig
+                         WEIGHTS_NAME, MMAP_WEIGHTS_NAME, TF2_WEIGHTS_NAME, TF_WEIGHTS_NAME, CONFIG_NAME,
+                         is_tf_available, is_torch_available, set_offline_mode, is_offline_mode)
+
+# Tokenizers, configurations and models are imported on first access (PEP 562 module __getattr__),
+# `from models.transformers import BertConfig` only loads configuration_utils and configuration_bert
+# instead of every model family. Set TRANSFORMERS_EAGER_IMPORT=1 to import everything up front.
+_import_structure = {
+    # Tokenizers
+    "tokenization_utils": ["PreTrainedTokenizer"],
+    "tokenization_auto": ["AutoTokenizer"],
+    "tokenization_bert": ["BertTokenizer", "BasicTokenizer", "WordpieceTokenizer"],
+    "tokenization_openai": ["OpenAIGPTTokenizer"],
+    "tokenization_transfo_xl": ["TransfoXLTokenizer", "TransfoXLCorpus"],
+    "tokenization_gpt2": ["GPT2Tokenizer"],
+    "tokenization_ctrl": ["CTRLTokenizer"],
+    "tokenization_xlnet": ["XLNetTokenizer", "SPIECE_UNDERLINE"],
+    "tokenization_xlm": ["XLMTokenizer"],
+    "tokenization_roberta": ["RobertaTokenizer"],
+    "tokenization_distilbert": ["DistilBertTokenizer"],
+    "tokenization_albert": ["FullTokenizer"],
+
+    # Configurations
+    "configuration_utils": ["PretrainedConfig"],
+    "configuration_auto": ["AutoConfig"],
+    "configuration_bert": ["BertConfig", "BERT_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_openai": ["OpenAIGPTConfig", "OPENAI_GPT_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_transfo_xl": ["TransfoXLConfig", "TRANSFO_XL_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_gpt2": ["GPT2Config", "GPT2_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_ctrl": ["CTRLConfig", "CTRL_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_xlnet": ["XLNetConfig", "XLNET_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_xlm": ["XLMConfig", "XLM_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_roberta": ["RobertaConfig", "ROBERTA_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_distilbert": ["DistilBertConfig", "DISTILBERT_PRETRAINED_CONFIG_ARCHIVE_MAP"],
+    "configuration_albert": ["AlbertConfig"],
+}
 
 # Modeling
 if is_torch_available():
-    from .modeling_utils import (PreTrainedModel, prune_layer, Conv1D)
-    from .modeling_auto import (AutoModel, AutoModelForSequenceClassification, AutoModelForQuestionAnswering,
-                                AutoModelWithLMHead)
-
-    from .modeling_bert import (BertPreTrainedModel, BertModel, BertForPreTraining,
-                                BertForMaskedLM, BertForNextSentencePrediction,
-                                BertForSequenceClassification, BertForMultipleChoice,
-                                BertForTokenClassification, BertForQuestionAnswering,
-                                load_tf_weights_in_bert, BERT_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_openai import (OpenAIGPTPreTrainedModel, OpenAIGPTModel,
-                                OpenAIGPTLMHeadModel, OpenAIGPTDoubleHeadsModel,
-                                load_tf_weights_in_openai_gpt, OPENAI_GPT_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_transfo_xl import (TransfoXLPreTrainedModel, TransfoXLModel, TransfoXLLMHeadModel,
-                                    load_tf_weights_in_transfo_xl, TRANSFO_XL_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_gpt2 import (GPT2PreTrainedModel, GPT2Model,
-                                GPT2LMHeadModel, GPT2DoubleHeadsModel,
-                                load_tf_weights_in_gpt2, GPT2_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_ctrl import (CTRLPreTrainedModel, CTRLModel,
-                                CTRLLMHeadModel,
-                                CTRL_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_xlnet import (XLNetPreTrainedModel, XLNetModel, XLNetLMHeadModel,
-                                XLNetForSequenceClassification, XLNetForMultipleChoice,
-                                XLNetForQuestionAnsweringSimple, XLNetForQuestionAnswering,
-                                load_tf_weights_in_xlnet, XLNET_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_xlm import (XLMPreTrainedModel , XLMModel,
-                            XLMWithLMHeadModel, XLMForSequenceClassification,
-                            XLMForQuestionAnswering, XLMForQuestionAnsweringSimple,
-                            XLM_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_roberta import (RobertaForMaskedLM, RobertaModel,
-                                RobertaForSequenceClassification, RobertaForMultipleChoice,
-                                ROBERTA_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_distilbert import (DistilBertForMaskedLM, DistilBertModel,
-                                DistilBertForSequenceClassification, DistilBertForQuestionAnswering,
-                                DISTILBERT_PRETRAINED_MODEL_ARCHIVE_MAP)
-    from .modeling_albert import AlbertModel
-
-if not is_tf_available() and not is_torch_available():
+    _import_structure.update({
+        "modeling_utils": ["PreTrainedModel", "prune_layer", "Conv1D",
+                           "save_mmap_state_dict", "load_mmap_state_dict"],
+        "modeling_auto": ["AutoModel", "AutoModelForSequenceClassification", "AutoModelForQuestionAnswering",
+                          "AutoModelWithLMHead"],
+        "modeling_bert": ["BertPreTrainedModel", "BertModel", "BertForPreTraining",
+                          "BertForMaskedLM", "BertForNextSentencePrediction",
+                          "BertForSequenceClassification", "BertForMultipleChoice",
+                          "BertForTokenClassification", "BertForQuestionAnswering",
+                          "load_tf_weights_in_bert", "BERT_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_openai": ["OpenAIGPTPreTrainedModel", "OpenAIGPTModel",
+                            "OpenAIGPTLMHeadModel", "OpenAIGPTDoubleHeadsModel",
+                            "load_tf_weights_in_openai_gpt", "OPENAI_GPT_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_transfo_xl": ["TransfoXLPreTrainedModel", "TransfoXLModel", "TransfoXLLMHeadModel",
+                                "load_tf_weights_in_transfo_xl", "TRANSFO_XL_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_gpt2": ["GPT2PreTrainedModel", "GPT2Model",
+                          "GPT2LMHeadModel", "GPT2DoubleHeadsModel",
+                          "load_tf_weights_in_gpt2", "GPT2_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_ctrl": ["CTRLPreTrainedModel", "CTRLModel",
+                          "CTRLLMHeadModel",
+                          "CTRL_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_xlnet": ["XLNetPreTrainedModel", "XLNetModel", "XLNetLMHeadModel",
+                           "XLNetForSequenceClassification", "XLNetForMultipleChoice",
+                           "XLNetForQuestionAnsweringSimple", "XLNetForQuestionAnswering",
+                           "load_tf_weights_in_xlnet", "XLNET_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_xlm": ["XLMPreTrainedModel", "XLMModel",
+                         "XLMWithLMHeadModel", "XLMForSequenceClassification",
+                         "XLMForQuestionAnswering", "XLMForQuestionAnsweringSimple",
+                         "XLM_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_roberta": ["RobertaForMaskedLM", "RobertaModel",
+                             "RobertaForSequenceClassification", "RobertaForMultipleChoice",
+                             "ROBERTA_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_distilbert": ["DistilBertForMaskedLM", "DistilBertModel",
+                                "DistilBertForSequenceClassification", "DistilBertForQuestionAnswering",
+                                "DISTILBERT_PRETRAINED_MODEL_ARCHIVE_MAP"],
+        "modeling_albert": ["AlbertModel"],
+    })
+
+_name_to_module = {name: module_name for module_name, names in _import_structure.items() for name in names}
+
+__all__ = ["TRANSFORMERS_CACHE", "PYTORCH_TRANSFORMERS_CACHE", "PYTORCH_PRETRAINED_BERT_CACHE",
+           "cached_path", "add_start_docstrings", "add_end_docstrings",
+           "WEIGHTS_NAME", "MMAP_WEIGHTS_NAME", "TF2_WEIGHTS_NAME", "TF_WEIGHTS_NAME", "CONFIG_NAME",
+           "is_tf_available", "is_torch_available", "set_offline_mode", "is_offline_mode"] + sorted(_name_to_module)
+
+
+def __getattr__(name):
+    """ Import the submodule that defines `name` and cache the attribute on the package. """
+    module_name = _name_to_module.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    module = importlib.import_module("." + module_name, __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_name_to_module))
+
+
+if os.environ.get("TRANSFORMERS_EAGER_IMPORT", "0") == "1":
+    for _name in _name_to_module:
+        __getattr__(_name)
+
+# is_torch_available() first, probing tensorflow is slow
+if not is_torch_available() and not is_tf_available():
     logger.warning("Neither PyTorch nor TensorFlow >= 2.0 have been found."
                    "Models won't be available and only tokenizers, configuration"
                    "and file/data utilities can be used.")
@@ -24,7 +24,7 @@ import logging
 import os
 from io import open
 
-from .file_utils import cached_path, CONFIG_NAME
+from .file_utils import cached_path, is_offline_mode, CONFIG_NAME
 
 logger = logging.getLogger(__name__)
 
@@ -132,6 +132,8 @@ class PretrainedConfig(object):
         try:
             resolved_config_file = cached_path(config_file, cache_dir=cache_dir, force_download=force_download, proxies=proxies)
         except EnvironmentError:
+            if is_offline_mode():
+                raise
             if pretrained_model_name_or_path in cls.pretrained_config_archive_map:
                 msg = "Couldn't reach server at '{}' to download pretrained model configuration file.".format(
                         config_file)
@@ -17,21 +17,12 @@ from functools import wraps
 from hashlib import sha256
 from io import open
 
-import boto3
-from botocore.config import Config
-from botocore.exceptions import ClientError
-import requests
-from tqdm import tqdm
+# boto3, requests and tqdm are only imported when a file has to be downloaded, they are slow to import
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
-try:
-    import tensorflow as tf
-    assert hasattr(tf, '__version__') and int(tf.__version__[0]) >= 2
-    _tf_available = True  # pylint: disable=invalid-name
-    logger.info("TensorFlow version {} available.".format(tf.__version__))
-except (ImportError, AssertionError):
-    _tf_available = False  # pylint: disable=invalid-name
+# importing tensorflow takes seconds, it is only probed by the first is_tf_available() call
+_tf_available = None  # pylint: disable=invalid-name
 
 try:
     import torch
@@ -68,16 +59,44 @@ PYTORCH_TRANSFORMERS_CACHE = PYTORCH_PRETRAINED_BERT_CACHE  # Kept for backward
 TRANSFORMERS_CACHE = PYTORCH_PRETRAINED_BERT_CACHE  # Kept for backward compatibility
 
 WEIGHTS_NAME = "pytorch_model.bin"
+MMAP_WEIGHTS_NAME = "pytorch_model.mmap"
 TF2_WEIGHTS_NAME = 'tf_model.h5'
 TF_WEIGHTS_NAME = 'model.ckpt'
 CONFIG_NAME = "config.json"
 
+# Offline mode (TRANSFORMERS_OFFLINE=1 or set_offline_mode()): urls are never requested, they are resolved
+# against a local model registry, a directory whose manifest.json maps each url to a file inside it,
+# and then against the files already in the cache dir.
+REGISTRY_MANIFEST_NAME = "manifest.json"
+_offline_mode = os.getenv('TRANSFORMERS_OFFLINE', '0') == '1'  # pylint: disable=invalid-name
+_model_registry = os.getenv('TRANSFORMERS_MODEL_REGISTRY')  # pylint: disable=invalid-name
+_registry_manifests = {}  # pylint: disable=invalid-name
+
 def is_torch_available():
     return _torch_available
 
 def is_tf_available():
+    global _tf_available
+    if _tf_available is None:
+        try:
+            import tensorflow as tf
+            assert hasattr(tf, '__version__') and int(tf.__version__[0]) >= 2
+            _tf_available = True  # pylint: disable=invalid-name
+            logger.info("TensorFlow version {} available.".format(tf.__version__))
+        except (ImportError, AssertionError):
+            _tf_available = False  # pylint: disable=invalid-name
     return _tf_available
 
+def set_offline_mode(offline=True, registry_dir=None):
+    """ Switch offline mode on or off, `registry_dir` (if given) replaces $TRANSFORMERS_MODEL_REGISTRY. """
+    global _offline_mode, _model_registry
+    _offline_mode = offline
+    if registry_dir is not None:
+        _model_registry = str(registry_dir)
+
+def is_offline_mode():
+    return _offline_mode
+
 if not six.PY2:
     def add_start_docstrings(*docstr):
         def docstring_decorator(fn):
@@ -185,6 +204,46 @@ def cached_path(url_or_filename, cache_dir=None, force_download=False, proxies=N
         raise ValueError("unable to parse {} as a URL or as a local path".format(url_or_filename))
 
 
+def load_registry_manifest(registry_dir):
+    """
+    Return the url -> relative path index of the model registry at `registry_dir`, read once per process.
+    Raise ``EnvironmentError`` if the registry has no manifest.
+    """
+    if registry_dir not in _registry_manifests:
+        manifest_path = os.path.join(registry_dir, REGISTRY_MANIFEST_NAME)
+        if not os.path.isfile(manifest_path):
+            raise EnvironmentError("model registry manifest {} not found".format(manifest_path))
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            _registry_manifests[registry_dir] = json.load(manifest_file)
+    return _registry_manifests[registry_dir]
+
+
+def resolve_offline(url, cache_dir):
+    """
+    Offline counterpart of `get_from_cache`: return the registry file listed for `url`, else the newest
+    cached download of `url`. Never touches the network, raise ``EnvironmentError`` if neither exists.
+    """
+    if _model_registry:
+        manifest = load_registry_manifest(_model_registry)
+        if url in manifest:
+            registry_path = os.path.join(_model_registry, manifest[url])
+            if not os.path.exists(registry_path):
+                raise EnvironmentError("{} is listed in the model registry manifest but {} does not exist".format(
+                    url, registry_path))
+            return registry_path
+
+    if os.path.isdir(cache_dir):
+        filename = url_to_filename(url)
+        matching_files = [f for f in os.listdir(cache_dir)
+                          if (f == filename or fnmatch.fnmatch(f, filename + '.*')) and not f.endswith('.json')]
+        if matching_files:
+            return max((os.path.join(cache_dir, f) for f in matching_files), key=os.path.getmtime)
+
+    raise EnvironmentError("Offline mode: {} is neither listed in the model registry ({}) nor cached in {}. "
+                           "Add it to the registry manifest or unset TRANSFORMERS_OFFLINE.".format(
+                               url, _model_registry or "$TRANSFORMERS_MODEL_REGISTRY is not set", cache_dir))
+
+
 def split_s3_path(url):
     """Split a full s3 path into the bucket name and path."""
     parsed = urlparse(url)
@@ -206,6 +265,7 @@ def s3_request(func):
 
     @wraps(func)
     def wrapper(url, *args, **kwargs):
+        from botocore.exceptions import ClientError
         try:
             return func(url, *args, **kwargs)
         except ClientError as exc:
@@ -220,6 +280,8 @@ def s3_request(func):
 @s3_request
 def s3_etag(url, proxies=None):
     """Check ETag on S3 object."""
+    import boto3
+    from botocore.config import Config
     s3_resource = boto3.resource("s3", config=Config(proxies=proxies))
     bucket_name, s3_path = split_s3_path(url)
     s3_object = s3_resource.Object(bucket_name, s3_path)
@@ -229,12 +291,16 @@ def s3_etag(url, proxies=None):
 @s3_request
 def s3_get(url, temp_file, proxies=None):
     """Pull a file directly from S3."""
+    import boto3
+    from botocore.config import Config
     s3_resource = boto3.resource("s3", config=Config(proxies=proxies))
     bucket_name, s3_path = split_s3_path(url)
     s3_resource.Bucket(bucket_name).download_fileobj(s3_path, temp_file)
 
 
 def http_get(url, temp_file, proxies=None):
+    import requests
+    from tqdm import tqdm
     req = requests.get(url, stream=True, proxies=proxies)
     content_length = req.headers.get('Content-Length')
     total = int(content_length) if content_length is not None else None
@@ -258,6 +324,11 @@ def get_from_cache(url, cache_dir=None, force_download=False, proxies=None):
     if sys.version_info[0] == 2 and not isinstance(cache_dir, str):
         cache_dir = str(cache_dir)
 
+    if _offline_mode:
+        if force_download:
+            raise EnvironmentError("Offline mode: can not force the download of {}".format(url))
+        return resolve_offline(url, cache_dir)
+
     if not os.path.exists(cache_dir):
         os.makedirs(cache_dir)
 
@@ -265,6 +336,7 @@ def get_from_cache(url, cache_dir=None, force_download=False, proxies=None):
     if url.startswith("s3://"):
         etag = s3_etag(url, proxies=proxies)
     else:
+        import requests
         try:
             response = requests.head(url, allow_redirects=True, proxies=proxies)
             if response.status_code != 200:
@@ -22,19 +22,146 @@ import copy
 import json
 import logging
 import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import open
 
 import six
+import numpy as np
 import torch
 from torch import nn
 from torch.nn import CrossEntropyLoss
 from torch.nn import functional as F
 
 from .configuration_utils import PretrainedConfig
-from .file_utils import cached_path, WEIGHTS_NAME, TF_WEIGHTS_NAME, TF2_WEIGHTS_NAME
+from .file_utils import cached_path, is_offline_mode, WEIGHTS_NAME, MMAP_WEIGHTS_NAME, TF_WEIGHTS_NAME, TF2_WEIGHTS_NAME
 
 logger = logging.getLogger(__name__)
 
+MMAP_MAGIC = b"TORCHMMP"
+MMAP_ALIGNMENT = 64
+_MMAP_DTYPES = {
+    'float32': torch.float32, 'float16': torch.float16, 'bfloat16': torch.bfloat16, 'float64': torch.float64,
+    'int64': torch.int64, 'int32': torch.int32, 'int16': torch.int16, 'int8': torch.int8,
+    'uint8': torch.uint8, 'bool': torch.bool,
+}
+_MMAP_DTYPE_NAMES = {dtype: name for name, dtype in _MMAP_DTYPES.items()}
+
+
+def _align(offset):
+    return (offset + MMAP_ALIGNMENT - 1) // MMAP_ALIGNMENT * MMAP_ALIGNMENT
+
+
+def save_mmap_state_dict(state_dict, filename):
+    """ Save a state dict in a flat format that :func:`load_mmap_state_dict` maps in memory without unpickling:
+        8 bytes magic, the length of the header as a little-endian uint64, a json header
+        ``{name: {"dtype", "shape", "offset", "nbytes"}}`` and the raw bytes of the tensors, every tensor starting
+        at a multiple of 64 bytes (``offset`` is relative to the first aligned byte after the header).
+    """
+    tensors = OrderedDict()
+    header = OrderedDict()
+    offset = 0
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu().contiguous()
+        if tensor.dtype not in _MMAP_DTYPE_NAMES:
+            raise ValueError("Can not save {} of dtype {} in the mmap format".format(name, tensor.dtype))
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {'dtype': _MMAP_DTYPE_NAMES[tensor.dtype], 'shape': list(tensor.shape),
+                        'offset': offset, 'nbytes': nbytes}
+        tensors[name] = tensor
+        offset = _align(offset + nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(len(MMAP_MAGIC) + 8 + len(header_bytes))
+    with open(filename, 'wb') as writer:
+        writer.write(MMAP_MAGIC)
+        writer.write(struct.pack('<Q', len(header_bytes)))
+        writer.write(header_bytes)
+        for name, tensor in tensors.items():
+            writer.write(b'\0' * (data_start + header[name]['offset'] - writer.tell()))
+            if tensor.numel() > 0:
+                writer.write(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+
+
+def load_mmap_state_dict(filename):
+    """ Map a file written by :func:`save_mmap_state_dict` in memory (copy-on-write) and return an OrderedDict of
+        cpu tensors viewing the mapped pages: nothing is read before it is used, processes loading the same file
+        share its pages in the page cache and writing to a tensor never modifies the file.
+    """
+    with open(filename, 'rb') as reader:
+        magic = reader.read(len(MMAP_MAGIC))
+        if magic != MMAP_MAGIC:
+            raise ValueError("{} is not a mmap weights file".format(filename))
+        header_length = struct.unpack('<Q', reader.read(8))[0]
+        header = json.loads(reader.read(header_length).decode('utf-8'), object_pairs_hook=OrderedDict)
+    data_start = _align(len(MMAP_MAGIC) + 8 + header_length)
+    buffer = np.memmap(filename, dtype=np.uint8, mode='c')
+    state_dict = OrderedDict()
+    for name, info in header.items():
+        start = data_start + info['offset']
+        data = torch.from_numpy(buffer[start:start + info['nbytes']])
+        state_dict[name] = data.view(_MMAP_DTYPES[info['dtype']]).reshape(info['shape'])
+    return state_dict
+
+
+# per thread, models may be loaded concurrently (e.g. by the tagging server)
+_init_weights_state = threading.local()
+
+
+def _init_weights_enabled():
+    return getattr(_init_weights_state, 'enabled', True)
+
+
+@contextmanager
+def no_init_weights():
+    """ Build models without :func:`PreTrainedModel.init_weights`, for weights that are about to be replaced by
+        pretrained ones. Only affects the current thread, the layers still run their own ``reset_parameters``.
+        Parameters left out by the checkpoint must be initialised afterwards.
+    """
+    enabled = _init_weights_enabled()
+    _init_weights_state.enabled = False
+    try:
+        yield
+    finally:
+        _init_weights_state.enabled = enabled
+
+
+def _get_submodule(module, path):
+    for name in filter(None, path.split('.')):
+        module = getattr(module, name)
+    return module
+
+
+def _assign_state_dict(model, state_dict, prefix=''):
+    """ Use the tensors of `state_dict` as the parameters and buffers of `model` (no copy) and return the
+        missing keys, the unexpected keys and the error messages like ``load_state_dict`` """
+    missing_keys, error_msgs = [], []
+    used = set()
+    for module_name, module in model.named_modules():
+        module_prefix = prefix + module_name + '.' if module_name else prefix
+        for name, param in list(module._parameters.items()) + list(module._buffers.items()):
+            if param is None:
+                continue
+            key = module_prefix + name
+            if key not in state_dict:
+                missing_keys.append(key)
+                continue
+            used.add(key)
+            tensor = state_dict[key]
+            if tensor.shape != param.shape:
+                error_msgs.append('size mismatch for {}: copying a param with shape {} from checkpoint, '
+                                  'the shape in current model is {}.'.format(key, tensor.shape, param.shape))
+                continue
+            if tensor.dtype != param.dtype:
+                tensor = tensor.to(param.dtype)
+            if name in module._parameters:
+                param.data = tensor
+            else:
+                module._buffers[name] = tensor
+    unexpected_keys = [key for key in state_dict.keys() if key not in used and key.startswith(prefix)]
+    return missing_keys, unexpected_keys, error_msgs
+
 
 try:
     from torch.nn import Identity
@@ -179,8 +306,9 @@ class PreTrainedModel(nn.Module):
 
     def init_weights(self):
         """ Initialize and prunes weights if needed. """
-        # Initialize weights
-        self.apply(self._init_weights)
+        # Initialize weights (skipped when from_pretrained overwrites them anyway, see `no_init_weights`)
+        if _init_weights_enabled():
+            self.apply(self._init_weights)
 
         # Prune heads if needed
         if self.config.pruned_heads:
@@ -203,9 +331,10 @@ class PreTrainedModel(nn.Module):
 
         base_model._prune_heads(heads_to_prune)
 
-    def save_pretrained(self, save_directory):
+    def save_pretrained(self, save_directory, save_mmap=False):
         """ Save a model and its configuration file to a directory, so that it
             can be re-loaded using the `:func:`~transformers.PreTrainedModel.from_pretrained`` class method.
+            With ``save_mmap=True`` the weights are also saved in the memory-mapped format (``pytorch_model.mmap``).
         """
         assert os.path.isdir(save_directory), "Saving path should be a directory where the model and configuration can be saved"
 
@@ -219,6 +348,22 @@ class PreTrainedModel(nn.Module):
         output_model_file = os.path.join(save_directory, WEIGHTS_NAME)
         torch.save(model_to_save.state_dict(), output_model_file)
         logger.info("Model weights saved in {}".format(output_model_file))
+        if save_mmap:
+            output_mmap_file = os.path.join(save_directory, MMAP_WEIGHTS_NAME)
+            save_mmap_state_dict(model_to_save.state_dict(), output_mmap_file)
+            logger.info("Model weights saved in {}".format(output_mmap_file))
+
+    @staticmethod
+    def _has_current_mmap(directory):
+        """ True if `directory` has a mmap weights file that is not older than its ``pytorch_model.bin`` """
+        mmap_file = os.path.join(directory, MMAP_WEIGHTS_NAME)
+        weights_file = os.path.join(directory, WEIGHTS_NAME)
+        if not os.path.isfile(mmap_file):
+            return False
+        if os.path.isfile(weights_file) and os.path.getmtime(weights_file) > os.path.getmtime(mmap_file):
+            logger.warning("Ignoring {} which is older than {}, convert it again".format(mmap_file, weights_file))
+            return False
+        return True
 
     @classmethod
     def from_pretrained(cls, pretrained_model_name_or_path, *model_args, **kwargs):
@@ -237,6 +382,7 @@ class PreTrainedModel(nn.Module):
 
                 - a string with the `shortcut name` of a pre-trained model to load from cache or download, e.g.: ``bert-base-uncased``.
                 - a path to a `directory` containing model weights saved using :func:`~transformers.PreTrainedModel.save_pretrained`, e.g.: ``./my_model_directory/``.
+                - a path to a `mmap weights file` written by :func:`save_mmap_state_dict` (see ``use_mmap``).
                 - a path or url to a `tensorflow index checkpoint file` (e.g. `./tf_model/model.ckpt.index`). In this case, ``from_tf`` should be set to True and a configuration object should be provided as ``config`` argument. This loading path is slower than converting the TensorFlow checkpoint in a PyTorch model using the provided conversion scripts and loading the PyTorch model afterwards.
                 - None if you are both providing the configuration and state dictionary (resp. with keyword arguments ``config`` and ``state_dict``)
 
@@ -269,6 +415,12 @@ class PreTrainedModel(nn.Module):
             output_loading_info: (`optional`) boolean:
                 Set to ``True`` to also return a dictionnary containing missing keys, unexpected keys and error messages.
 
+            use_mmap: (`optional`) boolean, default False:
+                Load ``pytorch_model.mmap`` instead of ``pytorch_model.bin`` when a directory contains an up-to-date one
+                (convert with ``tools/convert_pytorch_checkpoint_to_mmap.py``). The file is memory-mapped, its tensors
+                become the parameters without copy and ``init_weights`` is skipped. The random numbers drawn while
+                building the model differ from a regular load, so seeded runs are not reproducible across the two.
+
             kwargs: (`optional`) Remaining dictionary of keyword arguments:
                 Can be used to update the configuration object (after it being loaded) and initiate the model. (e.g. ``output_attention=True``). Behave differently depending on whether a `config` is provided or automatically loaded:
 
@@ -293,6 +445,7 @@ class PreTrainedModel(nn.Module):
         force_download = kwargs.pop('force_download', False)
         proxies = kwargs.pop('proxies', None)
         output_loading_info = kwargs.pop('output_loading_info', False)
+        use_mmap = kwargs.pop('use_mmap', False)
 
         # Load config
         if config is None:
@@ -316,6 +469,8 @@ class PreTrainedModel(nn.Module):
                 elif from_tf and os.path.isfile(os.path.join(pretrained_model_name_or_path, TF2_WEIGHTS_NAME)):
                     # Load from a TF 2.0 checkpoint
                     archive_file = os.path.join(pretrained_model_name_or_path, TF2_WEIGHTS_NAME)
+                elif use_mmap and cls._has_current_mmap(pretrained_model_name_or_path):
+                    archive_file = os.path.join(pretrained_model_name_or_path, MMAP_WEIGHTS_NAME)
                 elif os.path.isfile(os.path.join(pretrained_model_name_or_path, WEIGHTS_NAME)):
                     # Load from a PyTorch checkpoint
                     archive_file = os.path.join(pretrained_model_name_or_path, WEIGHTS_NAME)
@@ -333,6 +488,8 @@ class PreTrainedModel(nn.Module):
             try:
                 resolved_archive_file = cached_path(archive_file, cache_dir=cache_dir, force_download=force_download, proxies=proxies)
             except EnvironmentError:
+                if is_offline_mode():
+                    raise
                 if pretrained_model_name_or_path in cls.pretrained_model_archive_map:
                     msg = "Couldn't reach server at '{}' to download pretrained weights.".format(
                             archive_file)
@@ -354,8 +511,15 @@ class PreTrainedModel(nn.Module):
         else:
             resolved_archive_file = None
 
+        fast_load = state_dict is None and not from_tf and resolved_archive_file is not None \
+            and os.path.splitext(resolved_archive_file)[1] == os.path.splitext(MMAP_WEIGHTS_NAME)[1]
         # Instantiate model.
-        model = cls(config, *model_args, **model_kwargs)
+        if fast_load:
+            with no_init_weights():
+                model = cls(config, *model_args, **model_kwargs)
+            state_dict = load_mmap_state_dict(resolved_archive_file)
+        else:
+            model = cls(config, *model_args, **model_kwargs)
 
         if state_dict is None and not from_tf:
             state_dict = torch.load(resolved_archive_file, map_location='cpu')
@@ -415,7 +579,26 @@ class PreTrainedModel(nn.Module):
             if hasattr(model, cls.base_model_prefix) and not any(s.startswith(cls.base_model_prefix) for s in state_dict.keys()):
                 model_to_load = getattr(model, cls.base_model_prefix)
 
-            load(model_to_load, prefix=start_prefix)
+            if fast_load:
+                missing_keys, unexpected_keys, error_msgs = _assign_state_dict(model_to_load, state_dict, start_prefix)
+                # the parameters without pretrained weights still need the initialisation of init_weights
+                missing = set(missing_keys)
+                for module_path in sorted(set(key[len(start_prefix):].rpartition('.')[0] for key in missing_keys)):
+                    module = _get_submodule(model_to_load, module_path)
+                    module_prefix = start_prefix + module_path + '.' if module_path else start_prefix
+                    # the loaded (mapped) tensors of a partially initialized module are swapped out while it is
+                    # initialized in place, so that only its missing parameters get new values
+                    loaded = {name: p.data for name, p in module._parameters.items()
+                              if p is not None and module_prefix + name not in missing}
+                    for name, data in loaded.items():
+                        module._parameters[name].data = torch.empty_like(data)
+                    if hasattr(model, '_init_weights'):
+                        model._init_weights(module)
+                    for name, data in loaded.items():
+                        module._parameters[name].data = data
+                model.loaded_from_mmap = True
+            else:
+                load(model_to_load, prefix=start_prefix)
             if len(missing_keys) > 0:
                 logger.info("Weights of {} not initialized from pretrained model: {}".format(
                     model.__class__.__name__, missing_keys))
@@ -97,6 +97,50 @@ def load_vocab(vocab_file):
     return vocab
 
 
+# key of the trie node that ends a vocabulary entry, the value is the entry itself
+_TRIE_END = ''
+
+
+class _CharTable(dict):
+    """ str.translate table whose entry for a character is computed by `char_fn` the first time
+        the character is seen, the translation then runs in C for every character seen before. """
+
+    def __init__(self, char_fn):
+        super(_CharTable, self).__init__()
+        self.char_fn = char_fn
+
+    def __missing__(self, cp):
+        value = self[cp] = self.char_fn(chr(cp))
+        return value
+
+
+def _clean_char(char):
+    cp = ord(char)
+    if cp == 0 or cp == 0xfffd or _is_control(char):
+        return None
+    return " " if _is_whitespace(char) else cp
+
+
+def _chinese_char(char):
+    cp = ord(char)
+    return " " + char + " " if _is_chinese_codepoint(cp) else cp
+
+
+def _punctuation_char(char):
+    return " " + char + " " if _is_punctuation(char) else ord(char)
+
+
+def _accent_char(char):
+    return None if unicodedata.category(char) == "Mn" else ord(char)
+
+
+# translate tables of BasicTokenizer, filled on demand, shared by all instances
+_CLEAN_TABLE = _CharTable(_clean_char)
+_CHINESE_TABLE = _CharTable(_chinese_char)
+_PUNCTUATION_TABLE = _CharTable(_punctuation_char)
+_ACCENT_TABLE = _CharTable(_accent_char)
+
+
 def whitespace_tokenize(text):
     """Runs basic whitespace cleaning and splitting on a piece of text."""
     text = text.strip()
@@ -170,16 +214,23 @@ class BertTokenizer(PreTrainedTokenizer):
     def vocab_size(self):
         return len(self.vocab)
 
-    def _tokenize(self, text):
+    def _tokenize(self, text, word_cache=None):
         split_tokens = []
         if self.do_basic_tokenize:
             for token in self.basic_tokenizer.tokenize(text, never_split=self.all_special_tokens):
-                for sub_token in self.wordpiece_tokenizer.tokenize(token):
+                for sub_token in self.wordpiece_tokenizer.tokenize(token, cache=word_cache):
                     split_tokens.append(sub_token)
         else:
-            split_tokens = self.wordpiece_tokenizer.tokenize(text)
+            split_tokens = self.wordpiece_tokenizer.tokenize(text, cache=word_cache)
         return split_tokens
 
+    def tokenize_many(self, texts):
+        """ Tokenizes a batch of texts, same output as `[self.tokenize(text) for text in texts]`.
+            The word pieces of each distinct word are only looked up once per batch.
+        """
+        word_cache = {}
+        return [self.tokenize(text, word_cache=word_cache) for text in texts]
+
     def _convert_token_to_id(self, token):
         """ Converts a token (str/unicode) in an id using the vocab. """
         return self.vocab.get(token, self.vocab.get(self.unk_token))
@@ -322,84 +373,33 @@ class BasicTokenizer(object):
 
     def _run_strip_accents(self, text):
         """Strips accents from a piece of text."""
+        if text.isascii():
+            # NFD leaves ascii unchanged and there is no accent to strip
+            return text
         text = unicodedata.normalize("NFD", text)
-        output = []
-        for char in text:
-            cat = unicodedata.category(char)
-            if cat == "Mn":
-                continue
-            output.append(char)
-        return "".join(output)
+        return text.translate(_ACCENT_TABLE)
 
     def _run_split_on_punc(self, text, never_split=None):
-        """Splits punctuation on a piece of text."""
+        """Splits punctuation on a piece of text (a single token, without whitespace)."""
         if never_split is not None and text in never_split:
             return [text]
-        chars = list(text)
-        i = 0
-        start_new_word = True
-        output = []
-        while i < len(chars):
-            char = chars[i]
-            if _is_punctuation(char):
-                output.append([char])
-                start_new_word = True
-            else:
-                if start_new_word:
-                    output.append([])
-                start_new_word = False
-                output[-1].append(char)
-            i += 1
-
-        return ["".join(x) for x in output]
+        # every punctuation character on its own, runs of other characters kept together
+        return text.translate(_PUNCTUATION_TABLE).split()
 
     def _tokenize_chinese_chars(self, text):
         """Adds whitespace around any CJK character."""
-        output = []
-        for char in text:
-            cp = ord(char)
-            if self._is_chinese_char(cp):
-                output.append(" ")
-                output.append(char)
-                output.append(" ")
-            else:
-                output.append(char)
-        return "".join(output)
+        return text.translate(_CHINESE_TABLE)
 
     def _is_chinese_char(self, cp):
         """Checks whether CP is the codepoint of a CJK character."""
-        # This defines a "chinese character" as anything in the CJK Unicode block:
-        #   https://en.wikipedia.org/wiki/CJK_Unified_Ideographs_(Unicode_block)
-        #
-        # Note that the CJK Unicode block is NOT all Japanese and Korean characters,
-        # despite its name. The modern Korean Hangul alphabet is a different block,
-        # as is Japanese Hiragana and Katakana. Those alphabets are used to write
-        # space-separated words, so they are not treated specially and handled
-        # like the all of the other languages.
-        if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
-                (cp >= 0x3400 and cp <= 0x4DBF) or  #
-                (cp >= 0x20000 and cp <= 0x2A6DF) or  #
-                (cp >= 0x2A700 and cp <= 0x2B73F) or  #
-                (cp >= 0x2B740 and cp <= 0x2B81F) or  #
-                (cp >= 0x2B820 and cp <= 0x2CEAF) or
-                (cp >= 0xF900 and cp <= 0xFAFF) or  #
-                (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
-            return True
-
-        return False
+        return _is_chinese_codepoint(cp)
 
     def _clean_text(self, text):
         """Performs invalid character removal and whitespace cleanup on text."""
-        output = []
-        for char in text:
-            cp = ord(char)
-            if cp == 0 or cp == 0xfffd or _is_control(char):
-                continue
-            if _is_whitespace(char):
-                output.append(" ")
-            else:
-                output.append(char)
-        return "".join(output)
+        if text.isprintable() and "\ufffd" not in text:
+            # no control character and no whitespace other than " ", nothing to do
+            return text
+        return text.translate(_CLEAN_TABLE)
 
 
 class WordpieceTokenizer(object):
@@ -409,12 +409,28 @@ class WordpieceTokenizer(object):
         self.vocab = vocab
         self.unk_token = unk_token
         self.max_input_chars_per_word = max_input_chars_per_word
-
-    def tokenize(self, text):
+        # character tries of the vocabulary, built on first use by _build_tries()
+        self._tries = None
+
+    def _build_tries(self):
+        """ Two character tries over the vocabulary: one with every entry, for the start of a word, and one
+            with the "##" entries without their prefix, for the rest of the word. """
+        word_start, word_continuation = {}, {}
+        for token in self.vocab:
+            for trie, piece in ((word_start, token), (word_continuation, token[2:] if token.startswith("##") else "")):
+                if not piece:
+                    continue
+                node = trie
+                for char in piece:
+                    node = node.setdefault(char, {})
+                node[_TRIE_END] = token
+        return word_start, word_continuation
+
+    def tokenize(self, text, cache=None):
         """Tokenizes a piece of text into its word pieces.
 
         This uses a greedy longest-match-first algorithm to perform tokenization
-        using the given vocabulary.
+        using the given vocabulary: the longest match is found by walking the vocabulary trie.
 
         For example:
           input = "unaffable"
@@ -423,6 +439,7 @@ class WordpieceTokenizer(object):
         Args:
           text: A single token or whitespace separated tokens. This should have
             already been passed through `BasicTokenizer`.
+          cache: (`optional`) dict word -> word pieces shared across calls, see `BertTokenizer.tokenize_many`.
 
         Returns:
           A list of wordpiece tokens.
@@ -430,36 +447,61 @@ class WordpieceTokenizer(object):
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.unk_token)
+            if cache is not None and token in cache:
+                output_tokens.extend(cache[token])
                 continue
+            sub_tokens = self._tokenize_word(token)
+            if cache is not None:
+                cache[token] = sub_tokens
+            output_tokens.extend(sub_tokens)
+        return output_tokens
 
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
+    def _tokenize_word(self, token):
+        if len(token) > self.max_input_chars_per_word:
+            return [self.unk_token]
+        if self._tries is None:
+            self._tries = self._build_tries()
+        word_start, word_continuation = self._tries
+
+        start = 0
+        sub_tokens = []
+        while start < len(token):
+            node = word_start if start == 0 else word_continuation
+            cur_substr = None
+            for i in range(start, len(token)):
+                node = node.get(token[i])
+                if node is None:
                     break
-                sub_tokens.append(cur_substr)
-                start = end
+                if _TRIE_END in node:
+                    cur_substr, end = node[_TRIE_END], i + 1
+            if cur_substr is None:
+                return [self.unk_token]
+            sub_tokens.append(cur_substr)
+            start = end
+        return sub_tokens
+
+
+def _is_chinese_codepoint(cp):
+    """Checks whether CP is the codepoint of a CJK character."""
+    # This defines a "chinese character" as anything in the CJK Unicode block:
+    #   https://en.wikipedia.org/wiki/CJK_Unified_Ideographs_(Unicode_block)
+    #
+    # Note that the CJK Unicode block is NOT all Japanese and Korean characters,
+    # despite its name. The modern Korean Hangul alphabet is a different block,
+    # as is Japanese Hiragana and Katakana. Those alphabets are used to write
+    # space-separated words, so they are not treated specially and handled
+    # like the all of the other languages.
+    if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
+            (cp >= 0x3400 and cp <= 0x4DBF) or  #
+            (cp >= 0x20000 and cp <= 0x2A6DF) or  #
+            (cp >= 0x2A700 and cp <= 0x2B73F) or  #
+            (cp >= 0x2B740 and cp <= 0x2B81F) or  #
+            (cp >= 0x2B820 and cp <= 0x2CEAF) or
+            (cp >= 0xF900 and cp <= 0xFAFF) or  #
+            (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
+        return True
 
-            if is_bad:
-                output_tokens.append(self.unk_token)
-            else:
-                output_tokens.extend(sub_tokens)
-        return output_tokens
+    return False
 
 
 def _is_whitespace(char):
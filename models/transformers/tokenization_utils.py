@@ -23,10 +23,8 @@ import six
 import copy
 from io import open
 
-from .file_utils import cached_path, is_tf_available, is_torch_available
+from .file_utils import cached_path, is_offline_mode, is_tf_available, is_torch_available
 
-if is_tf_available():
-    import tensorflow as tf
 if is_torch_available():
     import torch
 
@@ -354,6 +352,8 @@ class PreTrainedTokenizer(object):
                 else:
                     resolved_vocab_files[file_id] = cached_path(file_path, cache_dir=cache_dir, force_download=force_download, proxies=proxies)
         except EnvironmentError:
+            if is_offline_mode():
+                raise
             if pretrained_model_name_or_path in s3_models:
                 msg = "Couldn't reach server at '{}' to download vocabulary files."
             else:
@@ -861,6 +861,7 @@ class PreTrainedTokenizer(object):
             token_type_ids = [0] * len(ids) + ([1] * len(pair_ids) if pair else [])
 
         if return_tensors == 'tf' and is_tf_available():
+            import tensorflow as tf
             sequence = tf.constant([sequence])
             token_type_ids = tf.constant([token_type_ids])
         elif return_tensors == 'pt' and is_torch_available():
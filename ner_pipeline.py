@@ -0,0 +1,454 @@
+""" In-process NER inference: the config, tokenizer, model and dependency parser are loaded once and
+raw texts are tagged without reading or writing any file.
+Example usage (tag a file, the parsing and the model forward run in parallel stages):
+  python ner_pipeline.py --model_dir=outputs/cluener_output/chinese_roberta_wwm_large_syntax --use_syntax \
+    --do_lower_case --input_file=datasets/cluener/test.json --output_file=test_entities.json --parse_workers 4
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from queue import Queue, Empty
+import torch
+from models.transformers import BertConfig, AlbertConfig, WEIGHTS_NAME, MMAP_WEIGHTS_NAME, CONFIG_NAME
+from models.bert_for_ner import BertCrfForNer, BertCrfForNerWithSyn
+from models.albert_for_ner import AlbertCrfForNer
+from processors.utils_ner import CNerTokenizer, get_entities, build_syntax_info
+from processors.dependency_parsing import parse_dependency
+from processors.ner_seq import InputExample, convert_examples_to_features, collate_fn
+from processors.ner_seq import ner_processors as processors
+from tools.common import init_logger, logger
+from tools.result_cache import ResultCache
+
+MODEL_CLASSES = {
+    'bert': (BertConfig, BertCrfForNer, CNerTokenizer),
+    'albert': (AlbertConfig, AlbertCrfForNer, CNerTokenizer),
+}
+
+PARSE_CACHE_FILE = 'parse_cache.pkl'
+ENTITY_CACHE_FILE = 'entity_cache.pkl'
+
+
+def checkpoint_id(model_dir, *settings):
+    '''
+    模型文件(大小和修改时间)和影响结果的参数的hash，换了模型或者重新训练之后缓存中的旧结果不会再命中
+    '''
+    digest = hashlib.sha1(repr(settings).encode('utf-8'))
+    if os.path.isdir(model_dir):
+        for name in (CONFIG_NAME, WEIGHTS_NAME, MMAP_WEIGHTS_NAME, 'vocab.txt'):
+            path = os.path.join(model_dir, name)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                digest.update("{}:{}:{}".format(name, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    else:
+        digest.update(model_dir.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class NerPipeline(object):
+    '''
+    加载一次模型和句法分析器，之后每次调用只需要做 句法分析 + 前向 + crf解码
+    Example:
+        >>> pipeline = NerPipeline("outputs/cluener_output/chinese_roberta_wwm_large_syntax", use_syntax=True)
+        >>> pipeline.tag(["浙商银行企业信贷部叶老桂博士则从另一个角度对五道门槛进行了解读。"])
+        [[{'type': 'company', 'start': 0, 'end': 3, 'text': '浙商银行'}, {'type': 'name', ...}]]
+    cache_size > 0 时缓存句法分析结果(key为文本)和实体(key为模型id+归一化的文本)，重复的文本只需要查一次缓存，
+    cache_ttl(秒)之后过期，cache_dir不为空时从中加载缓存，save_cache()保存到其中。
+    '''
+    def __init__(self, model_dir, task_name='cluener', model_type='bert', use_syntax=True, device=None,
+                 max_seq_length=128, batch_size=32, markup='bios', do_lower_case=True, parser=parse_dependency,
+                 cache_size=0, cache_ttl=None, cache_dir=None):
+        self.model_type = model_type
+        self.use_syntax = use_syntax
+        self.max_seq_length = max_seq_length
+        self.batch_size = batch_size
+        self.markup = markup
+        # the model without syntax ignores the span mask, so it does not need the parser
+        self.parser = parser if use_syntax else None
+        self.device = torch.device(device if device is not None else "cuda" if torch.cuda.is_available() else "cpu")
+        self.label_list = processors[task_name]().get_labels()
+        self.id2label = {i: label for i, label in enumerate(self.label_list)}
+
+        config_class, model_class, tokenizer_class = MODEL_CLASSES[model_type]
+        if model_type == 'bert' and use_syntax:
+            model_class = BertCrfForNerWithSyn
+        self.config = config_class.from_pretrained(model_dir, num_labels=len(self.label_list))
+        self.tokenizer = tokenizer_class.from_pretrained(model_dir, do_lower_case=do_lower_case)
+        # inference only: map pytorch_model.mmap when the model dir has one
+        self.model = model_class.from_pretrained(model_dir, config=self.config, use_mmap=True)
+        self.model.to(self.device)
+        self.model.eval()
+        self.pad_token_id = self.tokenizer.convert_tokens_to_ids([self.tokenizer.pad_token])[0]
+        logger.info("Loaded %s from %s on %s", model_class.__name__, model_dir, self.device)
+
+        self.checkpoint_id = checkpoint_id(model_dir, task_name, model_type, use_syntax, max_seq_length, markup,
+                                           do_lower_case)
+        self.cache_dir = cache_dir
+        self.parse_cache = None
+        self.entity_cache = None
+        if cache_size > 0:
+            if self.parser is not None:
+                self.parse_cache = ResultCache(cache_size, cache_ttl, name='parse')
+            self.entity_cache = ResultCache(cache_size, cache_ttl, name='entities')
+            self.load_cache()
+
+    def load_cache(self):
+        if not self.cache_dir:
+            return
+        for cache, file_name in ((self.parse_cache, PARSE_CACHE_FILE), (self.entity_cache, ENTITY_CACHE_FILE)):
+            cache_file = os.path.join(self.cache_dir, file_name)
+            if cache is not None and os.path.isfile(cache_file):
+                cache.load(cache_file)
+
+    def save_cache(self, merge=False):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for cache, file_name in ((self.parse_cache, PARSE_CACHE_FILE), (self.entity_cache, ENTITY_CACHE_FILE)):
+            if cache is not None:
+                cache.save(os.path.join(self.cache_dir, file_name), merge=merge)
+
+    def cache_stats(self):
+        return {cache.name: cache.stats() for cache in (self.parse_cache, self.entity_cache) if cache is not None}
+
+    def _entity_key(self, text):
+        if self.parser is None and self.tokenizer.do_lower_case:
+            # without parsing the characters are only seen lowercased, one by one, so the case does not matter
+            # (unless a character lowercases to several, which would shift the positions)
+            lowered = ''.join(c.lower() for c in text)
+            if len(lowered) == len(text):
+                text = lowered
+        return self.checkpoint_id, text
+
+    def cached_entities(self, text):
+        '''
+        缓存中text的实体列表，没有缓存或者没有命中时返回None
+        '''
+        if self.entity_cache is None:
+            return None
+        spans = self.entity_cache.get(self._entity_key(text))
+        if spans is None:
+            return None
+        # the key is normalised, the entity text is taken from this text
+        return [{'type': tag, 'start': start, 'end': end, 'text': text[start:end + 1]} for tag, start, end in spans]
+
+    def cache_entities(self, text, entities):
+        if self.entity_cache is not None:
+            self.entity_cache.put(self._entity_key(text),
+                                  tuple((entity['type'], entity['start'], entity['end']) for entity in entities))
+
+    def parse(self, texts):
+        '''
+        句法分析，返回每个text的 (lexicon_to_wordspan_dir, hpsg_list, leaves_list)
+        '''
+        if self.parse_cache is None:
+            return [build_syntax_info(text, parser=self.parser) for text in texts]
+        syntax_infos = []
+        for text in texts:
+            syntax_info = self.parse_cache.get(text)
+            if syntax_info is None:
+                syntax_info = build_syntax_info(text, parser=self.parser)
+                self.parse_cache.put(text, syntax_info)
+            syntax_infos.append(syntax_info)
+        return syntax_infos
+
+    def featurize(self, texts, syntax_infos):
+        examples = []
+        for i, (text, (lexicon_to_wordspan_dir, hpsg_list, leaves_list)) in enumerate(zip(texts, syntax_infos)):
+            examples.append(InputExample(guid="online-%d" % i, text_a=list(text), labels=['O'] * len(text),
+                                         lexicon_to_wordspan_dir=lexicon_to_wordspan_dir, hpsg_list=hpsg_list,
+                                         leaves_list=leaves_list))
+        return convert_examples_to_features(examples=examples, tokenizer=self.tokenizer, label_list=self.label_list,
+                                            max_seq_length=self.max_seq_length, cls_token=self.tokenizer.cls_token,
+                                            sep_token=self.tokenizer.sep_token, pad_token=self.pad_token_id,
+                                            log_examples=False)
+
+    def _to_batch(self, features):
+        return collate_fn([(torch.tensor(f.input_ids, dtype=torch.long),
+                            torch.tensor(f.input_mask, dtype=torch.long),
+                            torch.tensor(f.segment_ids, dtype=torch.long),
+                            torch.tensor(f.input_len, dtype=torch.long),
+                            torch.tensor(f.label_ids, dtype=torch.long),
+                            torch.tensor(f.input_span_mask, dtype=torch.long)) for f in features])
+
+    def forward(self, features):
+        '''
+        前向 + crf解码，返回每个feature去掉[CLS]/[SEP]之后的tag id
+        '''
+        # similar lengths in the same batch keep the padding small, the results are put back in input order
+        order = sorted(range(len(features)), key=lambda i: features[i].input_len)
+        preds = [None] * len(features)
+        with torch.no_grad():
+            for start in range(0, len(order), self.batch_size):
+                indices = order[start:start + self.batch_size]
+                batch = tuple(t.to(self.device) for t in self._to_batch([features[i] for i in indices]))
+                inputs = {"input_ids": batch[0], "attention_mask": batch[1], 'input_lens': batch[3], "labels": None,
+                          "input_span_mask": batch[5]}
+                inputs["token_type_ids"] = batch[2] if self.model_type == "bert" else None
+                logits = self.model(**inputs)[0]
+                tags = self.model.crf.decode(logits, inputs['attention_mask'])
+                tags = tags.squeeze(0).cpu().numpy().tolist()
+                input_lens = batch[3].cpu().numpy().tolist()
+                for i, tag, input_len in zip(indices, tags, input_lens):
+                    preds[i] = tag[1:input_len - 1]  # [CLS]XXXX[SEP]
+        return preds
+
+    def decode(self, texts, preds):
+        results = []
+        for text, pred in zip(texts, preds):
+            entities = []
+            for tag, start, end in get_entities(pred, self.id2label, self.markup):
+                entities.append({'type': tag, 'start': start, 'end': end, 'text': text[start:end + 1]})
+            results.append(entities)
+        return results
+
+    def tag(self, texts):
+        '''
+        :param texts: list of str
+        :return: 每个text的实体列表，实体为 {'type', 'start', 'end', 'text'}，start/end是字的下标(左闭右闭)
+        '''
+        if not texts:
+            return []
+        if self.entity_cache is None:
+            features = self.featurize(texts, self.parse(texts))
+            return self.decode(texts, self.forward(features))
+        results = [self.cached_entities(text) for text in texts]
+        # the texts missing from the cache, repeated ones are only tagged once
+        missing = list(OrderedDict.fromkeys(text for text, entities in zip(texts, results) if entities is None))
+        if missing:
+            features = self.featurize(missing, self.parse(missing))
+            tagged = dict(zip(missing, self.decode(missing, self.forward(features))))
+            for text, entities in tagged.items():
+                self.cache_entities(text, entities)
+            results = [entities if entities is not None else [dict(entity) for entity in tagged[text]]
+                       for text, entities in zip(texts, results)]
+        return results
+
+
+# marks the end of the input in the queues between the stages of PipelinedExecutor
+_STOP = object()
+
+
+class PipelinedExecutor(object):
+    '''
+    把NerPipeline拆成四个stage，stage之间用有界队列连接，各stage并行执行：
+    句法分析(parse_workers个线程) -> 特征和句法mask(feature_workers个线程) -> batch前向+viterbi解码(1个线程) -> 实体格式化
+    队列满时上游stage阻塞(backpressure)，吞吐量接近最慢的stage而不是所有stage之和。
+    pyhanlp在jvm中做句法分析时会释放GIL，所以多个parse线程可以并行。
+    Example:
+        >>> executor = PipelinedExecutor(pipeline, parse_workers=4)
+        >>> for entities in executor.run(texts):
+        >>>     print(entities)
+        >>> logger.info(executor.stage_times)
+    '''
+    def __init__(self, pipeline, parse_workers=4, feature_workers=1, queue_size=64):
+        self.pipeline = pipeline
+        self.parse_workers = parse_workers
+        self.feature_workers = feature_workers
+        self.queue_size = queue_size
+        # busy seconds of every stage during the last run, the largest one is the bottleneck
+        self.stage_times = {}
+        self._lock = threading.Lock()
+
+    def _add_time(self, stage, seconds):
+        with self._lock:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+
+    def _stage(self, name, in_queue, out_queue, fn, num_workers):
+        '''
+        启动num_workers个线程执行 out = fn(item)，最后一个退出的线程把_STOP传给下一个stage
+        '''
+        remaining = [num_workers]
+
+        def worker():
+            while True:
+                item = in_queue.get()
+                if item is _STOP:
+                    with self._lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last:
+                        out_queue.put(_STOP)
+                    else:
+                        # let the other workers of this stage see it too
+                        in_queue.put(_STOP)
+                    return
+                index, value, error = item
+                if error is None:
+                    start = time.time()
+                    try:
+                        value = fn(value)
+                    except Exception as e:
+                        error = e
+                    self._add_time(name, time.time() - start)
+                out_queue.put((index, value, error))
+
+        threads = [threading.Thread(target=worker, name='ner-{}-{}'.format(name, i), daemon=True)
+                   for i in range(num_workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _forward_stage(self, in_queue, out_queue):
+        '''
+        取出队列中已有的feature(最多batch_size个)组成一个batch，输入越快batch越大
+        '''
+        def worker():
+            stopped = False
+            while not stopped:
+                batch = [in_queue.get()]
+                while len(batch) < self.pipeline.batch_size and batch[-1] is not _STOP:
+                    try:
+                        batch.append(in_queue.get_nowait())
+                    except Empty:
+                        break
+                if batch[-1] is _STOP:
+                    stopped = True
+                    batch.pop()
+                failed = [item for item in batch if item[2] is not None]
+                batch = [item for item in batch if item[2] is None]
+                for item in failed:
+                    out_queue.put(item)
+                if batch:
+                    start = time.time()
+                    try:
+                        preds = self.pipeline.forward([feature for _, (_, feature), _ in batch])
+                        results = [(index, (text, pred), None) for (index, (text, _), _), pred in zip(batch, preds)]
+                    except Exception as e:
+                        results = [(index, None, e) for index, _, _ in batch]
+                    self._add_time('forward', time.time() - start)
+                    for item in results:
+                        out_queue.put(item)
+            out_queue.put(_STOP)
+
+        thread = threading.Thread(target=worker, name='ner-forward', daemon=True)
+        thread.start()
+        return [thread]
+
+    def _parse(self, text):
+        return text, self.pipeline.parse([text])[0]
+
+    def _featurize(self, value):
+        text, syntax_info = value
+        return text, self.pipeline.featurize([text], [syntax_info])[0]
+
+    def _format(self, value):
+        text, pred = value
+        entities = self.pipeline.decode([text], [pred])[0]
+        self.pipeline.cache_entities(text, entities)
+        return entities
+
+    def run(self, texts):
+        '''
+        按输入顺序逐个返回每个text的实体列表，某个text出错时抛出该异常
+        '''
+        self.stage_times = {}
+        queues = [Queue(maxsize=self.queue_size) for _ in range(5)]
+        threads = self._stage('parse', queues[0], queues[1], self._parse, self.parse_workers)
+        threads += self._stage('featurize', queues[1], queues[2], self._featurize, self.feature_workers)
+        threads += self._forward_stage(queues[2], queues[3])
+        threads += self._stage('format', queues[3], queues[4], self._format, 1)
+
+        def feed():
+            for index, text in enumerate(texts):
+                entities = self.pipeline.cached_entities(text)
+                if entities is not None:
+                    # already tagged, skips all the stages
+                    queues[4].put((index, entities, None))
+                else:
+                    queues[0].put((index, text, None))
+            queues[0].put(_STOP)
+        feeder = threading.Thread(target=feed, name='ner-feed', daemon=True)
+        feeder.start()
+
+        # the stages finish out of order, results are held back until all the previous ones are done
+        pending = {}
+        next_index = 0
+        first_error = None
+        while True:
+            item = queues[4].get()
+            if item is _STOP:
+                break
+            if first_error is not None:
+                # keep draining so that no stage stays blocked on a full queue
+                continue
+            pending[item[0]] = item
+            while next_index in pending:
+                _, value, error = pending.pop(next_index)
+                next_index += 1
+                if error is not None:
+                    first_error = error
+                    break
+                yield value
+        feeder.join()
+        for thread in threads:
+            thread.join()
+        if first_error is not None:
+            raise first_error
+
+    def tag(self, texts):
+        return list(self.run(texts))
+
+
+def main():
+    ''' Tag a file (one text per line, or cluener json lines with a "text" field) and write json lines '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, required=True)
+    parser.add_argument("--input_file", type=str, required=True)
+    parser.add_argument("--output_file", type=str, required=True)
+    parser.add_argument("--task_name", default="cluener", type=str)
+    parser.add_argument("--model_type", default="bert", type=str)
+    parser.add_argument("--use_syntax", action="store_true")
+    parser.add_argument("--do_lower_case", action="store_true")
+    parser.add_argument("--max_seq_length", default=128, type=int)
+    parser.add_argument("--batch_size", default=32, type=int)
+    parser.add_argument("--no_cuda", action="store_true")
+    parser.add_argument("--serial", action="store_true", help="Run the stages one after another (for comparison).")
+    parser.add_argument("--parse_workers", default=4, type=int)
+    parser.add_argument("--feature_workers", default=1, type=int)
+    parser.add_argument("--queue_size", default=64, type=int)
+    parser.add_argument("--cache_size", default=0, type=int,
+                        help="Cache the parses and entities of up to X texts, 0: no cache.")
+    parser.add_argument("--cache_ttl", default=0, type=float, help="Seconds before a cached result expires, 0: never.")
+    parser.add_argument("--cache_dir", default=None, type=str, help="Load the caches from and save them to this dir.")
+    args = parser.parse_args()
+    init_logger()
+    pipeline = NerPipeline(args.model_dir, task_name=args.task_name, model_type=args.model_type,
+                           use_syntax=args.use_syntax, device="cpu" if args.no_cuda else None,
+                           max_seq_length=args.max_seq_length, batch_size=args.batch_size,
+                           do_lower_case=args.do_lower_case, cache_size=args.cache_size,
+                           cache_ttl=args.cache_ttl or None, cache_dir=args.cache_dir)
+    texts = []
+    with open(args.input_file, 'r') as fr:
+        for line in fr:
+            line = line.rstrip('\n')
+            if line.startswith('{'):
+                line = json.loads(line)['text']
+            texts.append(line)
+    start = time.time()
+    if args.serial:
+        results = []
+        for i in range(0, len(texts), args.batch_size):
+            results.extend(pipeline.tag(texts[i:i + args.batch_size]))
+    else:
+        executor = PipelinedExecutor(pipeline, parse_workers=args.parse_workers,
+                                     feature_workers=args.feature_workers, queue_size=args.queue_size)
+        results = executor.tag(texts)
+        logger.info("Busy time per stage: %s", ", ".join("{} {:.1f}s".format(stage, seconds)
+                                                        for stage, seconds in executor.stage_times.items()))
+    elapsed = time.time() - start
+    logger.info("Tagged %d texts in %.1fs (%.1f texts/s)", len(texts), elapsed, len(texts) / max(elapsed, 1e-6))
+    for stats in pipeline.cache_stats().values():
+        logger.info("%s cache: %d hits, %d misses (hit rate %.1f%%), %d entries", stats['name'], stats['hits'],
+                    stats['misses'], stats['hit_rate'] * 100, stats['size'])
+    pipeline.save_cache()
+    with open(args.output_file, 'w') as fw:
+        for text, entities in zip(texts, results):
+            fw.write(json.dumps({'text': text, 'entities': entities}, ensure_ascii=False) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+""" HTTP tagging server around `NerPipeline` with dynamic micro-batching.
+
+Concurrent requests are queued and tagged together: the texts are grouped in buckets of similar length and a
+bucket is run as one batch when it holds --max_batch_size texts or its oldest text waited --max_wait_ms.
+Endpoints:
+  POST /tag    {"texts": ["...", ...]} (or {"text": "..."}) -> {"entities": [[{type, start, end, text}, ...], ...]}
+  GET  /stats  latency percentiles, batch size histogram, queue depth and cache hit rates (of the worker process
+               that answers)
+  GET  /health
+With --num_workers N (cpu only) the parent loads the model once, moves the weights to shared memory and forks N
+worker processes that accept on the same socket, each pinned to its own slice of cores, so the memory grows with
+the activations of the workers and not with N copies of the weights.
+Example usage:
+  python ner_server.py --model_dir=outputs/cluener_output/chinese_roberta_wwm_large_syntax --use_syntax --port 8080
+  python ner_server.py --model_dir=... --use_syntax --no_cuda --num_workers 4 --threads_per_worker 4
+  curl -d '{"texts": ["记者从东营市政府获悉"]}' http://127.0.0.1:8080/tag
+"""
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+from queue import Queue, Empty
+from collections import Counter, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from ner_pipeline import NerPipeline
+from tools.common import init_logger, logger
+
+
+class ServerStats(object):
+    '''
+    请求延迟(最近window个请求)、batch大小的直方图和排队长度
+    '''
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = Counter()
+        self.num_requests = 0
+        self.num_texts = 0
+        self.num_errors = 0
+        self.start_time = time.time()
+
+    def add_request(self, latency, num_texts, error=False):
+        with self._lock:
+            self.latencies.append(latency)
+            self.num_requests += 1
+            self.num_texts += num_texts
+            self.num_errors += int(error)
+
+    def add_batch(self, batch_size):
+        with self._lock:
+            self.batch_sizes[batch_size] += 1
+
+    def summary(self, queue_depth, cache_stats=None):
+        with self._lock:
+            latencies = np.array(self.latencies or [0.0]) * 1e3
+            uptime = time.time() - self.start_time
+            return {
+                'uptime_sec': uptime,
+                'requests': self.num_requests,
+                'texts': self.num_texts,
+                'errors': self.num_errors,
+                'texts_per_sec': self.num_texts / max(uptime, 1e-6),
+                'latency_p50_ms': float(np.percentile(latencies, 50)),
+                'latency_p90_ms': float(np.percentile(latencies, 90)),
+                'latency_p99_ms': float(np.percentile(latencies, 99)),
+                'batch_size_histogram': {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                'queue_depth': queue_depth,
+                'cache': cache_stats or {},
+                'pid': os.getpid(),
+            }
+
+
+class MicroBatcher(object):
+    '''
+    把并发请求中的文本按长度分桶，凑成batch后在一个后台线程中调用pipeline.tag
+    Example:
+        >>> batcher = MicroBatcher(pipeline, max_batch_size=32, max_wait_ms=5)
+        >>> futures = [batcher.submit(text) for text in texts]
+        >>> entities = [future.result() for future in futures]
+    '''
+    def __init__(self, pipeline, max_batch_size=32, max_wait_ms=5.0, bucket_width=16, stats=None):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.bucket_width = bucket_width
+        self.stats = stats if stats is not None else ServerStats()
+        self._queue = Queue()
+        # bucket id -> deque of (enqueue time, text, future), only touched by the batching thread
+        self._buckets = {}
+        self._pending = 0
+        self._thread = threading.Thread(target=self._worker, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() + self._pending
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((time.time(), text, future))
+        return future
+
+    def _bucket(self, text):
+        return min(len(text), self.pipeline.max_seq_length) // self.bucket_width
+
+    def _add(self, item):
+        self._buckets.setdefault(self._bucket(item[1]), deque()).append(item)
+        self._pending += 1
+
+    def _next_batch(self):
+        '''
+        返回一个满了或者等待超时的bucket中的文本，都没有时返回None
+        '''
+        now = time.time()
+        oldest_bucket, oldest_time = None, None
+        for bucket, items in self._buckets.items():
+            if len(items) >= self.max_batch_size:
+                return self._pop(bucket)
+            if oldest_time is None or items[0][0] < oldest_time:
+                oldest_bucket, oldest_time = bucket, items[0][0]
+        if oldest_bucket is not None and now - oldest_time >= self.max_wait:
+            return self._pop(oldest_bucket)
+        return None
+
+    def _pop(self, bucket):
+        items = self._buckets[bucket]
+        batch = [items.popleft() for _ in range(min(len(items), self.max_batch_size))]
+        if not items:
+            del self._buckets[bucket]
+        self._pending -= len(batch)
+        return batch
+
+    def _timeout(self):
+        if not self._buckets:
+            return None
+        oldest_time = min(items[0][0] for items in self._buckets.values())
+        return max(0.0, oldest_time + self.max_wait - time.time())
+
+    def _worker(self):
+        while True:
+            try:
+                self._add(self._queue.get(timeout=self._timeout()))
+                # take everything that arrived meanwhile without blocking
+                while True:
+                    self._add(self._queue.get_nowait())
+            except Empty:
+                pass
+            batch = self._next_batch()
+            while batch is not None:
+                self._run(batch)
+                batch = self._next_batch()
+
+    def _run(self, batch):
+        texts = [text for _, text, _ in batch]
+        self.stats.add_batch(len(batch))
+        try:
+            results = self.pipeline.tag(texts)
+        except Exception:
+            logger.exception("Failed to tag a batch of %d texts, retrying them one by one", len(texts))
+            # only the texts that fail on their own get an error, not everything batched with them
+            for _, text, future in batch:
+                try:
+                    future.set_result(self.pipeline.tag([text])[0])
+                except Exception as e:
+                    logger.exception("Failed to tag %r", text[:100])
+                    future.set_exception(e)
+            return
+        for (_, _, future), entities in zip(batch, results):
+            future.set_result(entities)
+
+
+def make_handler(batcher, stats, request_timeout=60.0):
+    class NerRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, code, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send_json(200, stats.summary(batcher.queue_depth, batcher.pipeline.cache_stats()))
+            elif self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/tag':
+                self._send_json(404, {'error': 'not found'})
+                return
+            start = time.time()
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(length).decode('utf-8'))
+                texts = data['texts'] if 'texts' in data else [data['text']]
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise ValueError("texts must be a list of strings")
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {'error': 'invalid request: {}'.format(e)})
+                return
+            futures = [batcher.submit(text) for text in texts]
+            try:
+                entities = [future.result(timeout=request_timeout) for future in futures]
+            except Exception as e:
+                stats.add_request(time.time() - start, len(texts), error=True)
+                self._send_json(500, {'error': str(e)})
+                return
+            stats.add_request(time.time() - start, len(texts))
+            self._send_json(200, {'entities': entities})
+
+        def log_message(self, format, *args):
+            # one line per request would flood the log under load
+            pass
+
+    return NerRequestHandler
+
+
+def get_argparse():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, required=True,
+                        help="Directory of the fine-tuned model (config.json, pytorch_model.bin, vocab.txt).")
+    parser.add_argument("--task_name", default="cluener", type=str)
+    parser.add_argument("--model_type", default="bert", type=str)
+    parser.add_argument("--use_syntax", action="store_true", help="The model is BertCrfForNerWithSyn.")
+    parser.add_argument("--max_seq_length", default=128, type=int)
+    parser.add_argument("--do_lower_case", action="store_true")
+    parser.add_argument("--no_cuda", action="store_true")
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", default=8080, type=int)
+    parser.add_argument("--max_batch_size", default=32, type=int, help="Largest micro-batch of texts.")
+    parser.add_argument("--max_wait_ms", default=5.0, type=float,
+                        help="Longest time a text waits in the queue for its micro-batch to fill up.")
+    parser.add_argument("--bucket_width", default=16, type=int,
+                        help="Texts whose lengths fall in the same window of X characters are batched together.")
+    parser.add_argument("--request_timeout", default=60.0, type=float)
+    parser.add_argument("--num_workers", default=1, type=int,
+                        help="If > 1: fork X cpu worker processes sharing the model weights and the listening socket.")
+    parser.add_argument("--threads_per_worker", default=0, type=int,
+                        help="Torch threads (and pinned cores) of every worker, 0: split the available cores evenly.")
+    parser.add_argument("--cache_size", default=0, type=int,
+                        help="Cache the parses and entities of up to X texts (per worker), 0: no cache.")
+    parser.add_argument("--cache_ttl", default=0, type=float, help="Seconds before a cached result expires, 0: never.")
+    parser.add_argument("--cache_dir", default=None, type=str,
+                        help="Load the caches from this dir at start up and save them to it at shutdown, "
+                             "the caches of all workers are merged.")
+    return parser
+
+
+def _shutdown_on_sigterm(server):
+    '''
+    SIGTERM (kill, docker stop, systemd) 和 ctrl-c 一样停止服务，serve_forever返回后照常保存缓存
+    '''
+    def handler(signum, frame):
+        # shutdown() waits for serve_forever to return, it can not be called from the handler interrupting it
+        threading.Thread(target=server.shutdown, name='shutdown', daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    # only once, the shutdown must not be interrupted by a SIGTERM sent to the whole process group
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def _serve(server, pipeline, args):
+    stats = ServerStats()
+    batcher = MicroBatcher(pipeline, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                           bucket_width=args.bucket_width, stats=stats)
+    server.RequestHandlerClass = make_handler(batcher, stats, args.request_timeout)
+    _shutdown_on_sigterm(server)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    # with several workers each one merges its cache into the files saved by the workers that finished before it
+    pipeline.save_cache(merge=args.num_workers > 1)
+
+
+def _serve_worker(rank, server, pipeline, args, cores):
+    if cores:
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(args.threads_per_worker if args.threads_per_worker > 0 else max(1, len(cores)))
+    logger.info("Worker %d (pid %d) serving on cores %s with %d threads", rank, os.getpid(), cores,
+                torch.get_num_threads())
+    _serve(server, pipeline, args)
+
+
+def serve_workers(server, pipeline, args):
+    '''
+    fork出args.num_workers个进程，共享父进程中的模型参数(shared memory)和监听的socket
+    '''
+    # the storages are moved to shared memory once, the forked workers map the same pages instead of copying them.
+    # weights loaded from pytorch_model.mmap already live in the page cache shared by all processes
+    if not getattr(pipeline.model, 'loaded_from_mmap', False):
+        pipeline.model.share_memory()
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    cores_per_worker = args.threads_per_worker if args.threads_per_worker > 0 else \
+        max(1, len(available) // args.num_workers)
+    context = mp.get_context('fork')
+    workers = []
+    for rank in range(args.num_workers):
+        cores = available[rank * cores_per_worker:(rank + 1) * cores_per_worker]
+        if len(cores) < cores_per_worker:
+            # more workers than cores: let the scheduler place the extra ones
+            cores = []
+        worker = context.Process(target=_serve_worker, args=(rank, server, pipeline, args, cores),
+                                 name='ner-server-{}'.format(rank), daemon=True)
+        worker.start()
+        workers.append(worker)
+    # installed after forking, the workers stop on SIGTERM through _serve
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        for worker in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                logger.warning("Worker %s exited with code %s", worker.name, worker.exitcode)
+    except KeyboardInterrupt:
+        for worker in workers:
+            # a SIGTERM was only sent to this process, forward it (the workers got a ctrl-c themselves)
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            # give them time to save their caches
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.kill()
+
+
+def main():
+    args = get_argparse().parse_args()
+    init_logger()
+    if args.num_workers > 1 and not args.no_cuda:
+        # cuda can not be used in forked processes
+        logger.info("--num_workers %d runs the model on cpu", args.num_workers)
+        args.no_cuda = True
+    pipeline = NerPipeline(args.model_dir, task_name=args.task_name, model_type=args.model_type,
+                           use_syntax=args.use_syntax, device="cpu" if args.no_cuda else None,
+                           max_seq_length=args.max_seq_length, batch_size=args.max_batch_size,
+                           do_lower_case=args.do_lower_case, cache_size=args.cache_size,
+                           cache_ttl=args.cache_ttl or None, cache_dir=args.cache_dir)
+    # the handler is set by _serve, in the worker processes when forking
+    server = ThreadingHTTPServer((args.host, args.port), BaseHTTPRequestHandler)
+    logger.info("Serving %s on http://%s:%d", args.model_dir, args.host, args.port)
+    if args.num_workers > 1:
+        serve_workers(server, pipeline, args)
+    else:
+        _serve(server, pipeline, args)
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
-from pyhanlp import *
 from queue import Queue
 
+# pyhanlp starts a JVM when it is imported, which does not survive a fork: load it on the first parse so that
+# processes forked by the server (ner_server.py --num_workers) start their own JVM
+_hanlp = None
+
+
+def get_hanlp():
+    global _hanlp
+    if _hanlp is None:
+        from pyhanlp import HanLP
+        _hanlp = HanLP
+    return _hanlp
+
 def build_hpsg_list(head_list):
     """构建hpsg列表，hpsg即在句法依存树中，每个结点所覆盖的idx范围
 
@@ -83,7 +94,7 @@ def build_leaves_list(head_list):
     return [leaf_list for leaf_list in leaves_list[1:]]
 
 def parse_dependency(input_text):
-    parse_rlt = HanLP.parseDependency(input_text)
+    parse_rlt = get_hanlp().parseDependency(input_text)
     lexicon_list = []
     head_list = []
     for word in parse_rlt.iterator():
@@ -92,7 +103,7 @@ def parse_dependency(input_text):
     return lexicon_list, head_list
   
 def main():
-    print(HanLP.parseDependency("浙商银行企业信贷部叶老桂博士则从另一个角度对五道门槛进行了解读。叶老桂认为，对目前国内商业银行而言，"))
+    print(get_hanlp().parseDependency("浙商银行企业信贷部叶老桂博士则从另一个角度对五道门槛进行了解读。叶老桂认为，对目前国内商业银行而言，"))
     lexicon_list, head_list = parse_dependency("浙商银行企业信贷部叶老桂博士则从另一个角度对五道门槛进行了解读。叶老桂认为，对目前国内商业银行而言，")
     print(build_leaves_list(head_list))
 
@@ -5,6 +5,7 @@ import os
 import copy
 import json
 import numpy as np
+from torch.autograd.profiler import record_function
 from .utils_ner import DataProcessor
 logger = logging.getLogger(__name__)
 
@@ -62,34 +63,44 @@ def collate_fn(batch):
     batch should be a list of (sequence, target, length) tuples...
     Returns a padded tensor of sequences sorted from longest to shortest,
     """
-    all_input_ids, all_attention_mask, all_token_type_ids, all_lens, all_labels, all_input_span_mask = map(torch.stack, zip(*batch))
-    max_len = max(all_lens).item()
-    all_input_ids = all_input_ids[:, :max_len]
-    all_attention_mask = all_attention_mask[:, :max_len]
-    all_token_type_ids = all_token_type_ids[:, :max_len]
-    all_labels = all_labels[:,:max_len]
-    all_input_span_mask = all_input_span_mask[:, :max_len, :max_len]
+    with record_function("collate"):
+        all_input_ids, all_attention_mask, all_token_type_ids, all_lens, all_labels, all_input_span_mask = map(torch.stack, zip(*batch))
+        max_len = max(all_lens).item()
+        all_input_ids = all_input_ids[:, :max_len]
+        all_attention_mask = all_attention_mask[:, :max_len]
+        all_token_type_ids = all_token_type_ids[:, :max_len]
+        all_labels = all_labels[:,:max_len]
+        all_input_span_mask = all_input_span_mask[:, :max_len, :max_len]
     return all_input_ids, all_attention_mask, all_token_type_ids, all_lens, all_labels, all_input_span_mask
 
 def convert_examples_to_features(examples,label_list,max_seq_length,tokenizer,
                                  cls_token_at_end=False,cls_token="[CLS]",cls_token_segment_id=1,
                                  sep_token="[SEP]",pad_on_left=False,pad_token=0,pad_token_segment_id=0,
-                                 sequence_a_segment_id=0,mask_padding_with_zero=True,):
+                                 sequence_a_segment_id=0,mask_padding_with_zero=True,log_examples=True):
     """ Loads a data file into a list of `InputBatch`s
         `cls_token_at_end` define the location of the CLS token:
             - False (Default, BERT/XLM pattern): [CLS] + A + [SEP] + B + [SEP]
             - True (XLNet/GPT pattern): A + [SEP] + B + [SEP] + [CLS]
         `cls_token_segment_id` define the segment id associated to the CLS token (0 for BERT, 2 for XLNet)
+        `log_examples` log the progress and the first examples (turned off for online inference)
     """
     """
     examples 中加入了提取出的句法信息，包括每个句法结点的词汇到单字的范围字典：lexicon_to_wordspan_dir ，和对应词汇的在依存树当中结点的覆盖范围：hpsg_list
     """
     label_map = {label: i for i, label in enumerate(label_list)}
+    # tokenizers with encode_batch map all texts to ids in one pass, tokens are then ids and so are cls/sep
+    fast_encode = hasattr(tokenizer, 'encode_batch')
+    if fast_encode:
+        all_token_ids = tokenizer.encode_batch([example.text_a for example in examples])
+        cls_token, sep_token = tokenizer.convert_tokens_to_ids([cls_token, sep_token])
     features = []
     for (ex_index, example) in enumerate(examples):
-        if ex_index % 10000 == 0:
+        if log_examples and ex_index % 10000 == 0:
             logger.info("Writing example %d of %d", ex_index, len(examples))
-        tokens = tokenizer.tokenize(example.text_a)
+        if fast_encode:
+            tokens = all_token_ids[ex_index].tolist()
+        else:
+            tokens = tokenizer.tokenize(example.text_a)
         label_ids = [label_map[x] for x in example.labels]
         # 需要把 基于lexicon的hpsg_list扩展成基于char的hpsg_list，注意，这里 都还是从1开始的编号
         char_hpsg_list = []
@@ -174,7 +185,7 @@ def convert_examples_to_features(examples,label_list,max_seq_length,tokenizer,
             label_ids = [label_map['O']] + label_ids
             segment_ids = [cls_token_segment_id] + segment_ids
 
-        input_ids = tokenizer.convert_tokens_to_ids(tokens)
+        input_ids = list(tokens) if fast_encode else tokenizer.convert_tokens_to_ids(tokens)
         # The mask has 1 for real tokens and 0 for padding tokens. Only real
         # tokens are attended to.
         input_mask = [1 if mask_padding_with_zero else 0] * len(input_ids)
@@ -211,9 +222,11 @@ def convert_examples_to_features(examples,label_list,max_seq_length,tokenizer,
         assert input_span_mask.shape[0] == max_seq_length
         assert input_span_mask.shape[1] == max_seq_length
 
-        if ex_index < 2:
+        if log_examples and ex_index < 2:
             logger.info("*** Example ***")
             logger.info("guid: %s", example.guid)
+            if fast_encode:
+                tokens = tokenizer.convert_ids_to_tokens(tokens)
             logger.info("tokens: %s", " ".join([str(x) for x in tokens]))
             logger.info("input_ids: %s", " ".join([str(x) for x in input_ids]))
             logger.info("input_mask: %s", " ".join([str(x) for x in input_mask]))
@@ -0,0 +1,59 @@
+""" Overlap batch loading and host-to-device copies with the forward/backward passes. """
+import time
+import torch
+from torch.autograd.profiler import record_function
+
+
+class DevicePrefetcher(object):
+    """Iterate a DataLoader and stage the next batch on `device` while the current one is being used.
+
+    On cuda the copies of the next batch are issued with non_blocking=True on a side stream (the
+    DataLoader should use pin_memory=True), on cpu the batches are passed through unchanged.
+    `data_wait_time` accumulates the seconds spent waiting for the DataLoader to produce a batch,
+    a large value compared to the step time means that training is input-bound.
+    Example:
+        >>> prefetcher = DevicePrefetcher(train_dataloader, args.device)
+        >>> for step, batch in enumerate(prefetcher):
+        >>>     outputs = model(*batch)
+        >>> logger.info("data wait: %.1fs", prefetcher.data_wait_time)
+    """
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.use_stream = self.device.type == 'cuda'
+        self.data_wait_time = 0.0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def reset_data_wait_time(self):
+        self.data_wait_time = 0.0
+
+    def _next(self, iterator, stream):
+        start = time.time()
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            return None
+        finally:
+            self.data_wait_time += time.time() - start
+        with record_function("h2d_copy"):
+            if stream is None:
+                return tuple(t.to(self.device) for t in batch)
+            with torch.cuda.stream(stream):
+                return tuple(t.to(self.device, non_blocking=True) for t in batch)
+
+    def __iter__(self):
+        stream = torch.cuda.Stream(self.device) if self.use_stream else None
+        iterator = iter(self.loader)
+        batch = self._next(iterator, stream)
+        while batch is not None:
+            if stream is not None:
+                current_stream = torch.cuda.current_stream(self.device)
+                current_stream.wait_stream(stream)
+                # the tensors were allocated on the side stream but are consumed on the current one
+                for t in batch:
+                    t.record_stream(current_stream)
+            next_batch = self._next(iterator, stream)
+            yield batch
+            batch = next_batch
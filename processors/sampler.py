@@ -0,0 +1,55 @@
+""" Samplers whose position in the epoch can be saved in a checkpoint and restored. """
+import math
+import torch
+from torch.utils.data import Sampler
+
+
+class ResumableRandomSampler(Sampler):
+    """Random sampler with a deterministic order per (seed, epoch) that can resume mid-epoch.
+
+    The permutation of an epoch only depends on `seed + epoch`, so restoring (epoch, position, seed)
+    from a checkpoint reproduces the exact data order and starts at the next unseen sample without
+    sampling or collating the skipped batches.
+    With `num_replicas > 1` every rank gets its own shard of the permutation, padded to the same
+    length like `DistributedSampler`.
+    Example:
+        >>> sampler = ResumableRandomSampler(train_dataset, seed=args.seed)
+        >>> sampler.set_epoch(epoch, position=0)
+        >>> state = sampler.state_dict(consumed=(step + 1) * batch_size)
+    """
+    def __init__(self, data_source, seed=0, num_replicas=1, rank=0):
+        self.data_source = data_source
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.num_samples = int(math.ceil(len(data_source) / num_replicas))
+        self.total_size = self.num_samples * num_replicas
+        self.epoch = 0
+        self.position = 0
+
+    def set_epoch(self, epoch, position=0):
+        """Select the epoch to iterate and the number of its samples (of this rank) to skip."""
+        self.epoch = epoch
+        self.position = position
+
+    def __iter__(self):
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        indices = torch.randperm(len(self.data_source), generator=g).tolist()
+        # pad so that every rank gets the same number of samples
+        indices += indices[:(self.total_size - len(indices))]
+        indices = indices[self.rank:self.total_size:self.num_replicas]
+        return iter(indices[self.position:])
+
+    def __len__(self):
+        return self.num_samples
+
+    def state_dict(self, consumed):
+        """`consumed`: number of samples of the current epoch already trained on (counted from its start)."""
+        if consumed >= self.num_samples:
+            return {'epoch': self.epoch + 1, 'position': 0, 'seed': self.seed}
+        return {'epoch': self.epoch, 'position': consumed, 'seed': self.seed}
+
+    def load_state_dict(self, state_dict):
+        self.seed = state_dict['seed']
+        self.set_epoch(state_dict['epoch'], state_dict['position'])
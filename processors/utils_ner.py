@@ -1,6 +1,7 @@
 import csv
 import json
 import torch
+import numpy as np
 from models.transformers import BertTokenizer
 from .dependency_parsing import build_hpsg_list, build_leaves_list, parse_dependency
 import logging
@@ -10,6 +11,9 @@ class CNerTokenizer(BertTokenizer):
         super().__init__(vocab_file=str(vocab_file), do_lower_case=do_lower_case)
         self.vocab_file = str(vocab_file)
         self.do_lower_case = do_lower_case
+        # codepoint -> id table of encode_batch, built on first use
+        self._id_table = None
+        self._id_table_size = None
 
     def tokenize(self, text):
         _tokens = []
@@ -22,6 +26,79 @@ class CNerTokenizer(BertTokenizer):
                 _tokens.append('[UNK]')
         return _tokens
 
+    def _char_id(self, c):
+        return self.convert_tokens_to_ids(self.tokenize(c))[0]
+
+    def _build_id_table(self):
+        """ codepoint -> id table of the vocab characters (and their uppercase forms when lowercasing),
+        -1 for the other codepoints, which encode_batch resolves with _char_id """
+        chars = set()
+        for token in self.vocab:
+            if len(token) == 1:
+                chars.add(token)
+                if self.do_lower_case:
+                    chars.update(c for c in (token.upper(), token.title()) if len(c) == 1)
+        table = np.full(max(map(ord, chars), default=0) + 1, -1, dtype=np.int64)
+        for c in chars:
+            table[ord(c)] = self._char_id(c)
+        return table
+
+    def encode_batch(self, texts):
+        """ 把一批文本按字直接映射成id，等价于对每个文本调用convert_tokens_to_ids(tokenize(text))
+        texts中的文本可以是str，也可以是字的列表(InputExample.text_a)
+        Returns:
+            每个文本一个np.int64数组，不含[CLS]/[SEP]
+        """
+        if not texts:
+            return []
+        # rebuilt if tokens were added since, they take precedence over the vocab
+        if self._id_table is None or self._id_table_size != len(self.added_tokens_encoder):
+            self._id_table = self._build_id_table()
+            self._id_table_size = len(self.added_tokens_encoder)
+            self._other_char_ids = {}
+        table = self._id_table
+        joined = [text if isinstance(text, str) else ''.join(text) for text in texts]
+        # all texts are decoded to codepoints in one call and looked up in one vectorised gather
+        codepoints = np.frombuffer(''.join(joined).encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+        ids = np.where(codepoints < len(table), table[np.minimum(codepoints, len(table) - 1)], -1)
+        # characters outside the vocab (or lowercasing to a vocab entry in an unusual way), memoised
+        for i in np.nonzero(ids < 0)[0]:
+            codepoint = int(codepoints[i])
+            if codepoint not in self._other_char_ids:
+                self._other_char_ids[codepoint] = self._char_id(chr(codepoint))
+            ids[i] = self._other_char_ids[codepoint]
+        results = np.split(ids, np.cumsum([len(text) for text in joined])[:-1])
+        for i, (text, text_joined) in enumerate(zip(texts, joined)):
+            if len(text) != len(text_joined):
+                # a list with multi-character words, which tokenize looks up as whole words
+                results[i] = np.array(self.convert_tokens_to_ids(self.tokenize(text)), dtype=np.int64)
+        return results
+
+def build_syntax_info(text, parser=parse_dependency):
+    """ 用parser对text做依存句法分析，返回convert_examples_to_features需要的句法信息
+    parser=None时不做句法分析，每个字作为一个挂在根节点上的lexicon (给不使用句法的模型用)
+    Returns:
+        lexicon_to_wordspan_dir: lexicon编号到其覆盖的字的范围(左闭右闭，从1开始编号)
+        hpsg_list: 每个lexicon在句法依存树中所覆盖的lexicon范围
+        leaves_list: 每个lexicon的子树所包含的叶子lexicon
+    """
+    if parser is None:
+        lexicon_list, head_list = list(text), [0] * len(text)
+    else:
+        # 获得训练句子的 词 列表 和 句法依存的head
+        lexicon_list, head_list = parser(text)
+    # lexicon的编号从1开始，因为0是虚拟根节点的idx
+    hpsg_list = build_hpsg_list(head_list)
+    leaves_list = build_leaves_list(head_list)
+    # 还需要构造一个 lexicon 所对应的word span的字典，word编号同样是从1开始，
+    lexicon_to_wordspan_dir = {}
+    cur_word_idx = 1 #记录当前的word编号
+    for idx, lexicon in enumerate(lexicon_list):
+        #区间的括号与hpsg_span的括号一致， 左闭右闭
+        lexicon_to_wordspan_dir[idx+1] = (cur_word_idx, cur_word_idx + len(lexicon) - 1)
+        cur_word_idx += len(lexicon)
+    return lexicon_to_wordspan_dir, hpsg_list, leaves_list
+
 class DataProcessor(object):
     """Base class for data converters for sequence classification data sets."""
 
@@ -82,18 +159,7 @@ class DataProcessor(object):
                     logger.info("Finish {cur}/{sum}".format(cur=i, sum=len(all_lines)))
                 line = json.loads(line.strip())
                 text = line['text']
-                # 获得训练句子的 词 列表 和 句法依存的head
-                lexicon_list, head_list = parse_dependency(text)
-                # lexicon的编号从1开始，因为0是虚拟根节点的idx
-                hpsg_list = build_hpsg_list(head_list)
-                leaves_list = build_leaves_list(head_list)
-                # 还需要构造一个 lexicon 所对应的word span的字典，word编号同样是从1开始，
-                lexicon_to_wordspan_dir = {}
-                cur_word_idx = 1 #记录当前的word编号
-                for idx, lexicon in enumerate(lexicon_list):
-                    #区间的括号与hpsg_span的括号一致， 左闭右闭
-                    lexicon_to_wordspan_dir[idx+1] = (cur_word_idx, cur_word_idx + len(lexicon) - 1)
-                    cur_word_idx += len(lexicon)
+                lexicon_to_wordspan_dir, hpsg_list, leaves_list = build_syntax_info(text)
                 
                 label_entities = line.get('label',None)
                 words = list(text)
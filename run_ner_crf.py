@@ -1,35 +1,59 @@
 import glob
+import math
 import logging
+import contextlib
 import os
+import sys
 import json
 import time
 import pickle
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, RandomSampler, SequentialSampler, TensorDataset
+from torch.autograd.profiler import record_function
+from torch.utils.data import DataLoader, SequentialSampler, TensorDataset
 from torch.utils.data.distributed import DistributedSampler
 from callback.optimizater.adamw import AdamW
+from callback.optimizater.adamw8bit import AdamW8bit
+from callback.optimizater.adafactor import AdaFactor
+from callback.optimizater.lamb import Lamb
+from callback.optimizater.lars import Lars
+from callback.optimizater.radam import RAdam
 from callback.lr_scheduler import get_linear_schedule_with_warmup
-from callback.progressbar import ProgressBar
+from callback.progressbar import ProgressBar, ThroughputMeter
+from callback.checkpointmanager import CheckpointManager
+from callback.metricslogger import MetricsLogger
+from callback.modelcheckpoint import ModelCheckpoint
+from callback.earlystopping import EarlyStopping
 from tools.common import seed_everything,json_to_text
+from tools.common import get_rng_state, set_rng_state, DeviceAverageMeter
 from tools.common import init_logger, logger
+from tools.profiler import StepProfiler
 
-from models.transformers import WEIGHTS_NAME, BertConfig, AlbertConfig
+from models.transformers import WEIGHTS_NAME, BertConfig, AlbertConfig, set_offline_mode
 from models.bert_for_ner import BertCrfForNer, BertCrfForNerWithSyn
 from models.albert_for_ner import AlbertCrfForNer
 from processors.utils_ner import CNerTokenizer, get_entities
 from processors.ner_seq import convert_examples_to_features
 from processors.ner_seq import ner_processors as processors
 from processors.ner_seq import collate_fn
+from processors.sampler import ResumableRandomSampler
+from processors.prefetcher import DevicePrefetcher
 from metrics.ner_metrics import SeqEntityScore
 from tools.finetuning_argparse import get_argparse
 
 def train(args, train_dataset, model, tokenizer):
     """ Train the model """
     args.train_batch_size = args.per_gpu_train_batch_size * max(1, args.n_gpu)
-    train_sampler = RandomSampler(train_dataset) if args.local_rank == -1 else DistributedSampler(train_dataset)
+    configure_large_batch(args)
+    if args.local_rank == -1:
+        train_sampler = ResumableRandomSampler(train_dataset, seed=args.seed)
+    else:
+        train_sampler = ResumableRandomSampler(train_dataset, seed=args.seed,
+                                               num_replicas=torch.distributed.get_world_size(),
+                                               rank=torch.distributed.get_rank())
     train_dataloader = DataLoader(train_dataset, sampler=train_sampler, batch_size=args.train_batch_size,
-                                  collate_fn=collate_fn)
+                                  collate_fn=collate_fn, **dataloader_kwargs(args))
+    train_prefetcher = DevicePrefetcher(train_dataloader, args.device)
     if args.max_steps > 0:
         t_total = args.max_steps
         args.num_train_epochs = args.max_steps // (len(train_dataloader) // args.gradient_accumulation_steps) + 1
@@ -57,7 +81,7 @@ def train(args, train_dataset, model, tokenizer):
          'lr': args.crf_learning_rate}
     ]
     args.warmup_steps = int(t_total * args.warmup_proportion)
-    optimizer = AdamW(optimizer_grouped_parameters, lr=args.learning_rate, eps=args.adam_epsilon)
+    optimizer = build_optimizer(args, optimizer_grouped_parameters)
     scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=args.warmup_steps,
                                                 num_training_steps=t_total)
     # Check if saved optimizer or scheduler states exist
@@ -77,9 +101,21 @@ def train(args, train_dataset, model, tokenizer):
         model = torch.nn.DataParallel(model)
     # Distributed training (should be after apex fp16 initialization)
     if args.local_rank != -1:
-        model = torch.nn.parallel.DistributedDataParallel(model, device_ids=[args.local_rank],
-                                                          output_device=args.local_rank,
-                                                          find_unused_parameters=True)
+        find_unused = args.ddp_find_unused_parameters
+        if not find_unused:
+            # parameters that never get a gradient (e.g. the BERT pooler) would make DDP wait for them forever,
+            # the per-step graph traversal of find_unused_parameters=True is only paid when there are some
+            unused = find_unused_parameters(args, model, next(iter(train_dataloader)))
+            find_unused = bool(unused)
+            if unused:
+                logger.info("  %d parameters without gradients, DDP searches for unused parameters every step: %s",
+                            len(unused), sorted(unused))
+        # cpu processes (gloo backend) must not pass device ids
+        device_ids = [args.local_rank] if args.device.type == 'cuda' else None
+        model = torch.nn.parallel.DistributedDataParallel(model, device_ids=device_ids,
+                                                          output_device=device_ids[0] if device_ids else None,
+                                                          find_unused_parameters=find_unused,
+                                                          bucket_cap_mb=args.ddp_bucket_cap_mb)
     # Train!
     logger.info("***** Running training *****")
     logger.info("  Num examples = %d", len(train_dataset))
@@ -94,81 +130,359 @@ def train(args, train_dataset, model, tokenizer):
     logger.info("  Total optimization steps = %d", t_total)
 
     global_step = 0
-    steps_trained_in_current_epoch = 0
+    epochs_trained = 0
+    samples_trained_in_current_epoch = 0
+    trainer_state = None
     # Check if continuing training from a checkpoint
     if os.path.exists(args.model_name_or_path) and "checkpoint" in args.model_name_or_path:
         # set global_step to gobal_step of last saved checkpoint from model path
         global_step = int(args.model_name_or_path.split("-")[-1].split("/")[0])
-        epochs_trained = global_step // (len(train_dataloader) // args.gradient_accumulation_steps)
-        steps_trained_in_current_epoch = global_step % (len(train_dataloader) // args.gradient_accumulation_steps)
+        trainer_state_file = os.path.join(args.model_name_or_path, "trainer_state.pt")
+        if os.path.isfile(trainer_state_file):
+            trainer_state = torch.load(trainer_state_file)
+            train_sampler.load_state_dict(trainer_state['sampler'])
+            epochs_trained = train_sampler.epoch
+            samples_trained_in_current_epoch = train_sampler.position
+        else:
+            # older checkpoints without a sampler state: derive the position from global_step
+            epochs_trained = global_step // (len(train_dataloader) // args.gradient_accumulation_steps)
+            steps_trained_in_current_epoch = global_step % (len(train_dataloader) // args.gradient_accumulation_steps)
+            samples_trained_in_current_epoch = (steps_trained_in_current_epoch * args.gradient_accumulation_steps
+                                                * args.train_batch_size)
         logger.info("  Continuing training from checkpoint, will skip to saved global_step")
         logger.info("  Continuing training from epoch %d", epochs_trained)
         logger.info("  Continuing training from global step %d", global_step)
-        logger.info("  Will skip the first %d steps in the first epoch", steps_trained_in_current_epoch)
+        logger.info("  Will start from sample %d of the first epoch", samples_trained_in_current_epoch)
 
-    tr_loss, logging_loss = 0.0, 0.0
+    checkpoint_manager = CheckpointManager(args.output_dir, keep_last=args.keep_last_checkpoints,
+                                           keep_best=args.keep_best_checkpoints)
+    # losses are summed on the device and only copied to the host on a progress bar refresh or a logging step
+    tr_loss_meter, window_loss_meter = DeviceAverageMeter(), DeviceAverageMeter()
+    profiler = StepProfiler(args.profile_steps, args.output_dir, 'train')
+    throughput_meter = ThroughputMeter()
+    metrics_file = os.path.join(args.output_dir, "train_metrics.jsonl")
+    metrics_logger = MetricsLogger(metrics_file) if args.local_rank in [-1, 0] else None
+    # keep the weights with the best dev f1 in output_dir/best_model, they are restored at the end of training
+    model_checkpoint, early_stopping = None, None
+    if args.save_best_model or args.early_stopping_patience > 0:
+        best_model_dir = os.path.join(args.output_dir, BEST_MODEL_DIR)
+        os.makedirs(best_model_dir, exist_ok=True)
+        model_checkpoint = ModelCheckpoint(best_model_dir, monitor='f1', arch=args.model_type, mode='max')
+        if args.early_stopping_patience > 0:
+            early_stopping = EarlyStopping(patience=args.early_stopping_patience, mode='max', monitor='f1',
+                                           min_delta=args.early_stopping_min_delta)
+    best_global_step = None
+    logging_loss = 0.0
     model.zero_grad()
     seed_everything(args.seed)  # Added here for reproductibility (even between python 2 and 3)
-    for _ in range(int(args.num_train_epochs)):
-        pbar = ProgressBar(n_total=len(train_dataloader), desc='Training')
-        for step, batch in enumerate(train_dataloader):
-            # Skip past any already trained steps if resuming training
-            if steps_trained_in_current_epoch > 0:
-                steps_trained_in_current_epoch -= 1
-                continue
+    if trainer_state is not None:
+        set_rng_state(trainer_state['rng_state'])
+    for epoch in range(epochs_trained, int(args.num_train_epochs)):
+        # the sampler skips the samples already trained on, so resuming costs nothing
+        train_sampler.set_epoch(epoch, samples_trained_in_current_epoch if epoch == epochs_trained else 0)
+        start_step = train_sampler.position // args.train_batch_size
+        pbar = ProgressBar(n_total=len(train_dataloader), desc='Training', refresh_steps=args.progress_bar_refresh_steps)
+        epoch_start = time.time()
+        train_prefetcher.reset_data_wait_time()
+        logging_data_wait = 0.0
+        for step, batch in enumerate(train_prefetcher, start=start_step):
+            profiler.step(step)
             model.train()
-            batch = tuple(t.to(args.device) for t in batch)
             inputs = {"input_ids": batch[0], "attention_mask": batch[1], 'input_lens': batch[3], "labels": batch[4], "input_span_mask":batch[5]}
             if args.model_type != "distilbert":
                 # XLM and RoBERTa don"t use segment_ids
                 inputs["token_type_ids"] = (batch[2] if args.model_type in ["bert", "xlnet"] else None)
-            outputs = model(**inputs)
-            loss = outputs[0]  # model outputs are always tuple in pytorch-transformers (see doc)
-            if args.n_gpu > 1:
-                loss = loss.mean()  # mean() to average on multi-gpu parallel training
-            if args.gradient_accumulation_steps > 1:
-                loss = loss / args.gradient_accumulation_steps
-            if args.fp16:
-                with amp.scale_loss(loss, optimizer) as scaled_loss:
-                    scaled_loss.backward()
+            # only all-reduce the gradients on the micro-batch that is followed by an optimizer step
+            if args.local_rank != -1 and (step + 1) % args.gradient_accumulation_steps != 0:
+                sync_context = model.no_sync()
             else:
-                loss.backward()
-            pbar(step, {'loss': loss.item()})
-            tr_loss += loss.item()
+                sync_context = contextlib.nullcontext()
+            with sync_context:
+                outputs = model(**inputs)
+                loss = outputs[0]  # model outputs are always tuple in pytorch-transformers (see doc)
+                if args.n_gpu > 1:
+                    loss = loss.mean()  # mean() to average on multi-gpu parallel training
+                if args.gradient_accumulation_steps > 1:
+                    loss = loss / args.gradient_accumulation_steps
+                with record_function("backward"):
+                    if args.fp16:
+                        with amp.scale_loss(loss, optimizer) as scaled_loss:
+                            scaled_loss.backward()
+                    else:
+                        loss.backward()
+            tr_loss_meter.update(loss)
+            window_loss_meter.update(loss)
+            throughput_meter.update(inputs['input_lens'], padded_tokens=inputs['input_ids'].numel())
+            if pbar.is_refresh_step(step):
+                pbar(step, {'loss': window_loss_meter.avg, 'samples/s': throughput_meter.samples_per_sec})
+                window_loss_meter.reset()
             if (step + 1) % args.gradient_accumulation_steps == 0:
-                if args.fp16:
-                    torch.nn.utils.clip_grad_norm_(amp.master_params(optimizer), args.max_grad_norm)
-                else:
-                    torch.nn.utils.clip_grad_norm_(model.parameters(), args.max_grad_norm)
-                scheduler.step()  # Update learning rate schedule
-                optimizer.step()
-                model.zero_grad()
+                with record_function("optimizer_step"):
+                    if args.fp16:
+                        torch.nn.utils.clip_grad_norm_(amp.master_params(optimizer), args.max_grad_norm)
+                    else:
+                        torch.nn.utils.clip_grad_norm_(model.parameters(), args.max_grad_norm)
+                    scheduler.step()  # Update learning rate schedule
+                    optimizer.step()
+                    model.zero_grad()
                 global_step += 1
+                if global_step == 1:
+                    # optimizer states are created lazily by the first step
+                    logger.info("  Optimizer (%s) state memory = %.1f MB", args.optimizer,
+                                optimizer_state_bytes(optimizer) / 1024 ** 2)
                 if args.local_rank in [-1, 0] and args.logging_steps > 0 and global_step % args.logging_steps == 0:
                     # Log metrics
                     print(" ")
+                    tr_loss = tr_loss_meter.sum
+                    record = {'global_step': global_step, 'epoch': epoch,
+                              'loss': (tr_loss - logging_loss) / args.logging_steps,
+                              'lr': optimizer.param_groups[0]['lr'],
+                              'data_wait_sec': train_prefetcher.data_wait_time - logging_data_wait}
+                    record.update(throughput_meter.summary())
+                    if args.device.type == 'cuda':
+                        record['peak_memory_mb'] = torch.cuda.max_memory_allocated(args.device) / 1024 ** 2
+                        torch.cuda.reset_peak_memory_stats(args.device)
+                    else:
+                        record['rss_mb'] = process_memory_mb()
+                    logger.info("  train loss = %.4f", record['loss'])
+                    logger.info("  %.1f samples/s, %.1f tokens/s, padding %.1f%%, step time p50/p90/p99 = "
+                                "%.1f/%.1f/%.1f ms, waiting for data %.1fs", record['samples_per_sec'],
+                                record['tokens_per_sec'], 100.0 * record['padding_ratio'], record['step_time_p50_ms'],
+                                record['step_time_p90_ms'], record['step_time_p99_ms'], record['data_wait_sec'])
+                    logging_loss = tr_loss
                     if args.local_rank == -1:
                         # Only evaluate when single GPU otherwise metrics may not average well
-                        evaluate(args, model, tokenizer)
+                        results = evaluate(args, model, tokenizer)
+                        checkpoint_manager.update_metric(global_step, results['f1'])
+                        record.update({'eval_' + key: value for key, value in results.items()})
+                        if model_checkpoint is not None:
+                            model_to_save = model.module if hasattr(model, "module") else model
+                            state = {'model': model_to_save, 'epoch': epoch, 'global_step': global_step,
+                                     'f1': results['f1']}
+                            if model_checkpoint.bert_epoch_step(state, results['f1']):
+                                best_global_step = global_step
+                        if early_stopping is not None:
+                            early_stopping.epoch_step(results['f1'])
+                    metrics_logger.log(record)
+                    # the evaluation is not part of the next window
+                    throughput_meter.reset()
+                    logging_data_wait = train_prefetcher.data_wait_time
                 if args.local_rank in [-1, 0] and args.save_steps > 0 and global_step % args.save_steps == 0:
-                    # Save model checkpoint
-                    output_dir = os.path.join(args.output_dir, "checkpoint-{}".format(global_step))
-                    if not os.path.exists(output_dir):
-                        os.makedirs(output_dir)
-                    model_to_save = (
-                        model.module if hasattr(model, "module") else model
-                    )  # Take care of distributed/parallel training
-                    model_to_save.save_pretrained(output_dir)
-                    torch.save(args, os.path.join(output_dir, "training_args.bin"))
-                    logger.info("Saving model checkpoint to %s", output_dir)
-                    tokenizer.save_vocabulary(output_dir)
-                    torch.save(optimizer.state_dict(), os.path.join(output_dir, "optimizer.pt"))
-                    torch.save(scheduler.state_dict(), os.path.join(output_dir, "scheduler.pt"))
-                    logger.info("Saving optimizer and scheduler states to %s", output_dir)
+                    # Save model checkpoint, the files are written by a background thread
+                    trainer_state = {'sampler': train_sampler.state_dict(consumed=(step + 1) * args.train_batch_size),
+                                     'rng_state': get_rng_state()}
+                    # the snapshot is not part of the throughput window
+                    throughput_meter.pause()
+                    checkpoint_manager.save(global_step, model, tokenizer, optimizer, scheduler, args,
+                                            trainer_state=trainer_state)
+                    throughput_meter.resume()
+                if early_stopping is not None and early_stopping.stop_training:
+                    break
         logger.info("\n")
+        epoch_time = time.time() - epoch_start
+        logger.info("  Epoch %d took %.1fs, waiting for data %.1fs (%.1f%%)", epoch, epoch_time,
+                    train_prefetcher.data_wait_time, 100.0 * train_prefetcher.data_wait_time / max(epoch_time, 1e-6))
         if 'cuda' in str(args.device):
             torch.cuda.empty_cache()
-    return global_step, tr_loss / global_step
+        if early_stopping is not None and early_stopping.stop_training:
+            logger.info("  Early stopping at global step %d", global_step)
+            break
+    profiler.stop()
+    if best_global_step is not None:
+        # the model saved by main() is the best one, not the last one
+        logger.info("  Restoring the best model of global step %d (f1 = %.4f)", best_global_step, model_checkpoint.best)
+        model_to_load = model.module if hasattr(model, "module") else model
+        model_to_load.load_state_dict(torch.load(os.path.join(model_checkpoint.base_path, WEIGHTS_NAME),
+                                                 map_location=args.device))
+    checkpoint_manager.close()
+    if metrics_logger is not None:
+        metrics_logger.close()
+        if args.plot_metrics:
+            from callback.trainingmonitor import TrainingMonitor
+            TrainingMonitor(args.output_dir, arch=args.model_type).plot_metrics(metrics_file)
+    return global_step, tr_loss_meter.sum / global_step
+
+
+def configure_large_batch(args):
+    """ Large-batch training: derive the gradient accumulation from --target_batch_size and scale the
+    learning rates and the warmup from --reference_batch_size (the batch size they were tuned for) """
+    world_size = torch.distributed.get_world_size() if args.local_rank != -1 else 1
+    if args.target_batch_size > 0:
+        args.gradient_accumulation_steps = max(1, math.ceil(args.target_batch_size / (args.train_batch_size * world_size)))
+    effective_batch_size = args.train_batch_size * args.gradient_accumulation_steps * world_size
+    if args.lr_scaling == 'none':
+        return
+    ratio = effective_batch_size / args.reference_batch_size
+    factor = ratio if args.lr_scaling == 'linear' else math.sqrt(ratio)
+    args.learning_rate *= factor
+    args.crf_learning_rate *= factor
+    # larger learning rates need a longer warmup, grow it with sqrt(ratio) but keep half of the run for decay
+    args.warmup_proportion = min(0.5, args.warmup_proportion * math.sqrt(max(1.0, ratio)))
+    logger.info("  Effective batch size %d (%d x %d accumulation x %d processes), %s scaling x%.3f from batch size %d: "
+                "learning_rate = %g, crf_learning_rate = %g, warmup_proportion = %.3f",
+                effective_batch_size, args.train_batch_size, args.gradient_accumulation_steps, world_size,
+                args.lr_scaling, factor, args.reference_batch_size, args.learning_rate, args.crf_learning_rate,
+                args.warmup_proportion)
+
+
+def build_optimizer(args, optimizer_grouped_parameters):
+    """ Create the optimizer selected by --optimizer, the per-group learning rates and weight decays
+    (bert / crf / classifier) are kept by every optimizer """
+    if args.optimizer == 'adafactor':
+        # factored second moments, no first moment unless --adafactor_beta1 > 0
+        optimizer = AdaFactor(optimizer_grouped_parameters, lr=args.learning_rate, beta1=args.adafactor_beta1)
+    elif args.optimizer == 'lamb':
+        optimizer = Lamb(optimizer_grouped_parameters, lr=args.learning_rate, eps=args.adam_epsilon,
+                         foreach=args.foreach_optimizer)
+    elif args.optimizer == 'radam':
+        optimizer = RAdam(optimizer_grouped_parameters, lr=args.learning_rate, eps=args.adam_epsilon,
+                          foreach=args.foreach_optimizer)
+    elif args.optimizer == 'lars':
+        optimizer = Lars(optimizer_grouped_parameters, lr=args.learning_rate, momentum=args.lars_momentum)
+    elif args.optimizer == 'adamw8bit':
+        optimizer = AdamW8bit(optimizer_grouped_parameters, lr=args.learning_rate, eps=args.adam_epsilon,
+                              block_size=args.optim_block_size)
+    else:
+        optimizer = AdamW(optimizer_grouped_parameters, lr=args.learning_rate, eps=args.adam_epsilon,
+                          foreach=args.foreach_optimizer)
+    num_params = sum(p.numel() for group in optimizer.param_groups for p in group['params'])
+    logger.info("  Optimizer = %s, %.1fM parameters", args.optimizer, num_params / 1e6)
+    return optimizer
+
+
+def optimizer_state_bytes(optimizer):
+    return sum(v.numel() * v.element_size() for state in optimizer.state.values()
+               for v in state.values() if torch.is_tensor(v))
+
+
+def process_memory_mb():
+    """ Resident memory of this process in MB (the peak where /proc is not available), None if unknown """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on linux, bytes on macos
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def find_unused_parameters(args, model, batch):
+    """ Run one forward/backward pass on `batch` and return the names of the parameters without gradient on any rank """
+    model.train()
+    batch = tuple(t.to(args.device) for t in batch)
+    inputs = {"input_ids": batch[0], "attention_mask": batch[1], 'input_lens': batch[3], "labels": batch[4], "input_span_mask":batch[5]}
+    if args.model_type != "distilbert":
+        # XLM and RoBERTa don"t use segment_ids
+        inputs["token_type_ids"] = (batch[2] if args.model_type in ["bert", "xlnet"] else None)
+    model.zero_grad()
+    model(**inputs)[0].backward()
+    named_parameters = [(name, p) for name, p in model.named_parameters() if p.requires_grad]
+    flags = torch.tensor([float(p.grad is None) for _, p in named_parameters], device=args.device)
+    model.zero_grad()
+    if args.local_rank != -1:
+        # the ranks must agree, DDP hangs when only some of them expect gradients for a parameter
+        torch.distributed.all_reduce(flags, op=torch.distributed.ReduceOp.MAX)
+    return {name for (name, _), flag in zip(named_parameters, flags.tolist()) if flag}
+
+
+# approximate bytes of optimizer state per parameter, allocated by the first optimizer step (after the probe)
+OPTIMIZER_STATE_BYTES_PER_PARAM = {'adamw': 8, 'lamb': 8, 'radam': 8, 'adamw8bit': 2, 'adafactor': 1, 'lars': 4}
+
+
+def probe_batch_size(args, model, batch_size):
+    """ Run forward+backward on a synthetic worst-case batch (every sample at train_max_seq_length with a dense
+    span mask) and return the peak cuda memory in bytes, or None on out of memory """
+    seq_len = args.train_max_seq_length
+    vocab_size = model.config.vocab_size
+    inputs = {
+        "input_ids": torch.randint(1, vocab_size, (batch_size, seq_len), device=args.device),
+        "attention_mask": torch.ones(batch_size, seq_len, dtype=torch.long, device=args.device),
+        "input_lens": torch.full((batch_size,), seq_len, dtype=torch.long, device=args.device),
+        "labels": torch.randint(0, model.config.num_labels, (batch_size, seq_len), device=args.device),
+        "input_span_mask": torch.ones(batch_size, seq_len, seq_len, dtype=torch.long, device=args.device),
+    }
+    if args.model_type != "distilbert":
+        inputs["token_type_ids"] = (torch.zeros(batch_size, seq_len, dtype=torch.long, device=args.device)
+                                    if args.model_type in ["bert", "xlnet"] else None)
+    model.train()
+    model.zero_grad()
+    torch.cuda.empty_cache()
+    torch.cuda.reset_peak_memory_stats(args.device)
+    try:
+        model(**inputs)[0].backward()
+        torch.cuda.synchronize(args.device)
+        peak = torch.cuda.max_memory_allocated(args.device)
+    except RuntimeError as e:
+        if 'out of memory' not in str(e):
+            raise
+        peak = None
+    del inputs
+    model.zero_grad()
+    torch.cuda.empty_cache()
+    return peak
+
+
+def find_max_batch_size(args, model):
+    """ --auto_batch_size: binary search the largest per-gpu train batch whose forward+backward fits in
+    --auto_batch_size_memory_fraction of the device memory (minus the optimizer state), then choose the
+    gradient accumulation that keeps the effective batch size """
+    if args.device.type != 'cuda':
+        logger.warning("--auto_batch_size needs a cuda device, keeping per_gpu_train_batch_size = %d",
+                       args.per_gpu_train_batch_size)
+        return
+    total_memory = torch.cuda.get_device_properties(args.device).total_memory
+    num_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    if args.optimizer in OPTIMIZER_STATE_BYTES_PER_PARAM:
+        state_bytes_per_param = OPTIMIZER_STATE_BYTES_PER_PARAM[args.optimizer]
+    else:
+        state_bytes_per_param = max(OPTIMIZER_STATE_BYTES_PER_PARAM.values())
+        logger.warning("  Unknown optimizer state size of --optimizer %s, assuming %d bytes per parameter",
+                       args.optimizer, state_bytes_per_param)
+    optimizer_state = num_params * state_bytes_per_param
+    budget = total_memory * args.auto_batch_size_memory_fraction - optimizer_state
+
+    def fits(batch_size):
+        peak = probe_batch_size(args, model, batch_size)
+        logger.info("  Probing batch size %d: %s", batch_size,
+                    "out of memory" if peak is None else "peak %.0f MB" % (peak / 1024 ** 2))
+        return peak is not None and peak <= budget
+
+    # grow exponentially to find an upper bound, then bisect between the last fitting and the first failing size
+    low, high = 0, 1
+    while high <= args.max_auto_batch_size and fits(high):
+        low, high = high, high * 2
+    high = min(high, args.max_auto_batch_size + 1)
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    if args.local_rank != -1:
+        # every process must use the same batch size
+        found = torch.tensor(low, device=args.device)
+        torch.distributed.all_reduce(found, op=torch.distributed.ReduceOp.MIN)
+        low = int(found.item())
+    if low == 0:
+        raise RuntimeError("--auto_batch_size: a batch of 1 sequence of length {} does not fit in {:.0f} MB".format(
+            args.train_max_seq_length, budget / 1024 ** 2))
+
+    effective_batch_size = args.per_gpu_train_batch_size * args.gradient_accumulation_steps
+    if args.target_batch_size > 0:
+        # configure_large_batch derives the accumulation from the target batch size
+        args.per_gpu_train_batch_size = min(low, args.target_batch_size)
+    else:
+        args.gradient_accumulation_steps = math.ceil(effective_batch_size / low)
+        args.per_gpu_train_batch_size = math.ceil(effective_batch_size / args.gradient_accumulation_steps)
+    logger.info("  Auto batch size: largest fitting batch %d (budget %.0f MB of %.0f MB, optimizer state %.0f MB), "
+                "per_gpu_train_batch_size = %d, gradient_accumulation_steps = %d", low, budget / 1024 ** 2,
+                total_memory / 1024 ** 2, optimizer_state / 1024 ** 2, args.per_gpu_train_batch_size,
+                args.gradient_accumulation_steps)
 
 
 def evaluate(args, model, tokenizer, prefix=""):
@@ -176,24 +490,22 @@ def evaluate(args, model, tokenizer, prefix=""):
     eval_output_dir = args.output_dir
     if not os.path.exists(eval_output_dir) and args.local_rank in [-1, 0]:
         os.makedirs(eval_output_dir)
-    eval_dataset = load_and_cache_examples(args, args.task_name, tokenizer, data_type='dev')
     args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
-    # Note that DistributedSampler samples randomly
-    eval_sampler = SequentialSampler(eval_dataset) if args.local_rank == -1 else DistributedSampler(eval_dataset)
-    eval_dataloader = DataLoader(eval_dataset, sampler=eval_sampler, batch_size=args.eval_batch_size,
-                                 collate_fn=collate_fn)
+    eval_dataloader = get_eval_dataloader(args, tokenizer, data_type='dev', batch_size=args.eval_batch_size)
+    eval_dataset = eval_dataloader.dataset
     # Eval!
     logger.info("***** Running evaluation %s *****", prefix)
     logger.info("  Num examples = %d", len(eval_dataset))
     logger.info("  Batch size = %d", args.eval_batch_size)
-    eval_loss = 0.0
-    nb_eval_steps = 0
-    pbar = ProgressBar(n_total=len(eval_dataloader), desc="Evaluating")
+    eval_loss_meter = DeviceAverageMeter()
+    pbar = ProgressBar(n_total=len(eval_dataloader), desc="Evaluating", refresh_steps=args.progress_bar_refresh_steps)
     if isinstance(model, nn.DataParallel):
         model = model.module
-    for step, batch in enumerate(eval_dataloader):
+    eval_prefetcher = DevicePrefetcher(eval_dataloader, args.device)
+    profiler = StepProfiler(args.profile_steps, args.output_dir, 'evaluate')
+    for step, batch in enumerate(eval_prefetcher):
+        profiler.step(step)
         model.eval()
-        batch = tuple(t.to(args.device) for t in batch)
         with torch.no_grad():
             inputs = {"input_ids": batch[0], "attention_mask": batch[1], 'input_lens': batch[3], "labels": batch[4], "input_span_mask":batch[5]}
             if args.model_type != "distilbert":
@@ -201,29 +513,32 @@ def evaluate(args, model, tokenizer, prefix=""):
                 inputs["token_type_ids"] = (batch[2] if args.model_type in ["bert", "xlnet"] else None)
             outputs = model(**inputs)
             tmp_eval_loss, logits = outputs[:2]
-            tags = model.crf.decode(logits, inputs['attention_mask'])
+            with record_function("crf_decode"):
+                tags = model.crf.decode(logits, inputs['attention_mask'])
         if args.n_gpu > 1:
             tmp_eval_loss = tmp_eval_loss.mean()  # mean() to average on multi-gpu parallel evaluating
-        eval_loss += tmp_eval_loss.item()
-        nb_eval_steps += 1
-        out_label_ids = inputs['labels'].cpu().numpy().tolist()
-        input_lens = inputs['input_lens'].cpu().numpy().tolist()
-        tags = tags.squeeze(0).cpu().numpy().tolist()
-        for i, label in enumerate(out_label_ids):
-            temp_1 = []
-            temp_2 = []
-            for j, m in enumerate(label):
-                if j == 0:
-                    continue
-                elif j == input_lens[i] - 1:
-                    metric.update(pred_paths=[temp_2], label_paths=[temp_1])
-                    break
-                else:
-                    temp_1.append(args.id2label[out_label_ids[i][j]])
-                    temp_2.append(args.id2label[tags[i][j]])
+        eval_loss_meter.update(tmp_eval_loss)
+        with record_function("metric_update"):
+            out_label_ids = inputs['labels'].cpu().numpy().tolist()
+            input_lens = inputs['input_lens'].cpu().numpy().tolist()
+            tags = tags.squeeze(0).cpu().numpy().tolist()
+            for i, label in enumerate(out_label_ids):
+                temp_1 = []
+                temp_2 = []
+                for j, m in enumerate(label):
+                    if j == 0:
+                        continue
+                    elif j == input_lens[i] - 1:
+                        metric.update(pred_paths=[temp_2], label_paths=[temp_1])
+                        break
+                    else:
+                        temp_1.append(args.id2label[out_label_ids[i][j]])
+                        temp_2.append(args.id2label[tags[i][j]])
         pbar(step)
+    profiler.stop()
     logger.info("\n")
-    eval_loss = eval_loss / nb_eval_steps
+    logger.info("  Waiting for data %.1fs", eval_prefetcher.data_wait_time)
+    eval_loss = eval_loss_meter.avg
     eval_info, entity_info = metric.result()
     results = {f'{key}': value for key, value in eval_info.items()}
     results['loss'] = eval_loss
@@ -242,23 +557,22 @@ def predict(args, model, tokenizer, prefix=""):
     pred_output_dir = args.output_dir
     if not os.path.exists(pred_output_dir) and args.local_rank in [-1, 0]:
         os.makedirs(pred_output_dir)
-    test_dataset = load_and_cache_examples(args, args.task_name, tokenizer, data_type='test')
-    # Note that DistributedSampler samples randomly
-    test_sampler = SequentialSampler(test_dataset) if args.local_rank == -1 else DistributedSampler(test_dataset)
-    test_dataloader = DataLoader(test_dataset, sampler=test_sampler, batch_size=1, collate_fn=collate_fn)
+    test_dataloader = get_eval_dataloader(args, tokenizer, data_type='test', batch_size=1)
+    test_dataset = test_dataloader.dataset
     # Eval!
     logger.info("***** Running prediction %s *****", prefix)
     logger.info("  Num examples = %d", len(test_dataset))
     logger.info("  Batch size = %d", 1)
     results = []
     output_predict_file = os.path.join(pred_output_dir, prefix, "test_prediction.json")
-    pbar = ProgressBar(n_total=len(test_dataloader), desc="Predicting")
+    pbar = ProgressBar(n_total=len(test_dataloader), desc="Predicting", refresh_steps=args.progress_bar_refresh_steps)
 
     if isinstance(model, nn.DataParallel):
         model = model.module
-    for step, batch in enumerate(test_dataloader):
+    profiler = StepProfiler(args.profile_steps, args.output_dir, 'predict')
+    for step, batch in enumerate(DevicePrefetcher(test_dataloader, args.device)):
+        profiler.step(step)
         model.eval()
-        batch = tuple(t.to(args.device) for t in batch)
         with torch.no_grad():
             inputs = {"input_ids": batch[0], "attention_mask": batch[1], 'input_lens': batch[3], "labels": None, "input_span_mask":batch[5]}
             if args.model_type != "distilbert":
@@ -266,7 +580,8 @@ def predict(args, model, tokenizer, prefix=""):
                 inputs["token_type_ids"] = (batch[2] if args.model_type in ["bert", "xlnet"] else None)
             outputs = model(**inputs)
             logits = outputs[0]
-            tags = model.crf.decode(logits, inputs['attention_mask'])
+            with record_function("crf_decode"):
+                tags = model.crf.decode(logits, inputs['attention_mask'])
             tags  = tags.squeeze(0).cpu().numpy().tolist()
         preds = tags[0][1:-1]  # [CLS]XXXX[SEP]
         label_entities = get_entities(preds, args.id2label, args.markup)
@@ -276,6 +591,7 @@ def predict(args, model, tokenizer, prefix=""):
         json_d['entities'] = label_entities
         results.append(json_d)
         pbar(step)
+    profiler.stop()
     logger.info("\n")
     with open(output_predict_file, "w") as writer:
         for record in results:
@@ -310,8 +626,99 @@ def predict(args, model, tokenizer, prefix=""):
             test_submit.append(json_d)
         json_to_text(output_submit_file,test_submit)
 
+# directory of --save_best_model in output_dir, a copy of one of the checkpoints that is not evaluated/predicted again
+BEST_MODEL_DIR = "best_model"
+
+
+def is_best_model_dir(args, path):
+    return os.path.normpath(path) == os.path.normpath(os.path.join(args.output_dir, BEST_MODEL_DIR))
+
+
+# dev/test loaders keyed by (data_type, max_seq_length, batch_size, local_rank), built once per process
+_eval_dataloaders = {}
+
+
+def get_eval_dataloader(args, tokenizer, data_type='dev', batch_size=1, dataset=None):
+    """ Build the dev/test DataLoader on first use and reuse it for every later evaluation.
+    `evaluate` runs every `logging_steps`, so the cached features are only loaded and tensorised once.
+    On cuda the batches are pinned so that they can be copied to the device with non_blocking=True.
+    `dataset` can be given to seed the cache with tensors that are already in memory (e.g. shared
+    from the parent process by `run_checkpoints_in_pool`).
+    """
+    key = (data_type, args.task_name, args.eval_max_seq_length, batch_size, args.local_rank)
+    if key not in _eval_dataloaders:
+        if dataset is None:
+            dataset = load_and_cache_examples(args, args.task_name, tokenizer, data_type=data_type)
+        # Note that DistributedSampler samples randomly
+        sampler = SequentialSampler(dataset) if args.local_rank == -1 else DistributedSampler(dataset)
+        _eval_dataloaders[key] = DataLoader(dataset, sampler=sampler, batch_size=batch_size,
+                                            collate_fn=collate_fn, **dataloader_kwargs(args))
+    return _eval_dataloaders[key]
+
+
+def dataloader_kwargs(args):
+    """ DataLoader options shared by the train and eval loaders: `collate_fn` (stacking the [L, L] span
+    masks) runs in `--dataloader_num_workers` worker processes and batches are pinned on cuda. """
+    kwargs = {'num_workers': args.dataloader_num_workers, 'pin_memory': 'cuda' in str(args.device)}
+    if args.dataloader_num_workers > 0:
+        kwargs['persistent_workers'] = True
+    return kwargs
+
+
+# per-process state of the checkpoint pool workers, filled by `_init_checkpoint_worker`
+_checkpoint_worker_state = {}
+
+
+def _init_checkpoint_worker(args, model_class, config, tokenizer, data_type, dataset, batch_size, num_threads):
+    init_logger()
+    # pool workers are daemonic and can not start DataLoader worker processes
+    args.dataloader_num_workers = 0
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    get_eval_dataloader(args, tokenizer, data_type=data_type, batch_size=batch_size, dataset=dataset)
+    _checkpoint_worker_state.update(args=args, model_class=model_class, config=config,
+                                    tokenizer=tokenizer, data_type=data_type)
+
+
+def _run_checkpoint_worker(checkpoint):
+    state = _checkpoint_worker_state
+    args = state['args']
+    prefix = checkpoint.split('/')[-1] if checkpoint.find('checkpoint') != -1 else ""
+    # weights are only loaded once the worker picks the checkpoint up
+    model = state['model_class'].from_pretrained(checkpoint, config=state['config'])
+    model.to(args.device)
+    if state['data_type'] == 'dev':
+        result = evaluate(args, model, state['tokenizer'], prefix=prefix)
+    else:
+        predict(args, model, state['tokenizer'], prefix=prefix)
+        result = {}
+    del model
+    return checkpoint, result
+
+
+def run_checkpoints_in_pool(args, checkpoints, model_class, config, tokenizer, data_type='dev'):
+    """ Evaluate (data_type='dev') or predict (data_type='test') several checkpoints concurrently.
+    The features are tensorised once in this process and moved to shared memory, every worker of the
+    pool maps the same copy. Returns a list of (checkpoint, result) in the order of `checkpoints`.
+    """
+    batch_size = args.eval_batch_size if data_type == 'dev' else 1
+    dataset = get_eval_dataloader(args, tokenizer, data_type=data_type, batch_size=batch_size).dataset
+    for tensor in dataset.tensors:
+        tensor.share_memory_()
+    num_workers = min(args.checkpoint_workers, len(checkpoints))
+    # split the intra-op threads between workers when they all run on the cpu
+    num_threads = 0 if 'cuda' in str(args.device) else max(1, torch.get_num_threads() // num_workers)
+    logger.info("Running %d checkpoints with %d workers", len(checkpoints), num_workers)
+    ctx = torch.multiprocessing.get_context('spawn')
+    with ctx.Pool(num_workers, initializer=_init_checkpoint_worker,
+                  initargs=(args, model_class, config, tokenizer, data_type, dataset, batch_size,
+                            num_threads)) as pool:
+        results = dict(pool.imap_unordered(_run_checkpoint_worker, checkpoints))
+    return [(checkpoint, results[checkpoint]) for checkpoint in checkpoints]
+
+
 def load_and_cache_examples(args, task, tokenizer, data_type='train'):
-    if args.local_rank not in [-1, 0] and not evaluate:
+    if args.local_rank not in [-1, 0] and data_type == 'train':
         torch.distributed.barrier()  # Make sure only the first process in distributed training process the dataset, and the others will use the cache
     processor = processors[task]()
     # Load data features from cache or dataset file
@@ -375,7 +782,7 @@ def load_and_cache_examples(args, task, tokenizer, data_type='train'):
         if args.local_rank in [-1, 0]:
             logger.info("Saving features into cached file %s", cached_features_file)
             torch.save(features, cached_features_file)
-    if args.local_rank == 0 and not evaluate:
+    if args.local_rank == 0 and data_type == 'train':
         torch.distributed.barrier()  # Make sure only the first process in distributed training process the dataset, and the others will use the cache
     # Convert to Tensors and build dataset
     all_input_ids = torch.tensor([f.input_ids for f in features], dtype=torch.long)
@@ -388,20 +795,46 @@ def load_and_cache_examples(args, task, tokenizer, data_type='train'):
     return dataset
 
 
-def main():
-    args = get_argparse().parse_args()
+def _cpu_ddp_worker(local_rank, args):
+    os.environ["RANK"] = str(local_rank)
+    args.local_rank = local_rank
+    main(args)
+
+
+def launch_cpu_ddp(args):
+    """ Run `main` in `--num_cpu_procs` cpu processes on this machine, synchronised by the gloo backend.
+    To train across several machines use `python -m torch.distributed.launch --nnodes ... --no_cuda` instead,
+    every process then initialises gloo from the environment set by the launcher.
+    """
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", "29500")
+    os.environ["WORLD_SIZE"] = str(args.num_cpu_procs)
+    os.environ["LOCAL_WORLD_SIZE"] = str(args.num_cpu_procs)
+    args.no_cuda = True
+    torch.multiprocessing.spawn(_cpu_ddp_worker, args=(args,), nprocs=args.num_cpu_procs, join=True)
+
+
+def main(args=None):
+    if args is None:
+        args = get_argparse().parse_args()
+        if args.num_cpu_procs > 1 and args.local_rank == -1:
+            launch_cpu_ddp(args)
+            return
+    if (args.local_rank != -1 or args.num_cpu_procs > 1) and (args.save_best_model or args.early_stopping_patience > 0):
+        # the dev set is only evaluated during training without distribution, see train()
+        raise ValueError("--save_best_model and --early_stopping_patience are not supported in distributed training")
     MODEL_CLASSES = {
     ## bert ernie bert_wwm bert_wwwm_ext
     'bert': (BertConfig, BertCrfForNerWithSyn if args.use_syntax else BertCrfForNer, CNerTokenizer),
     'albert': (AlbertConfig, AlbertCrfForNer, CNerTokenizer)
 }
-    if not os.path.exists(args.output_dir):
-        os.mkdir(args.output_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
     args.output_dir = args.output_dir + '{model_type}{use_syntax}'.format(model_type=args.model_name_or_path.split('/')[-1], use_syntax="_syntax" if args.use_syntax else "")
-    if not os.path.exists(args.output_dir):
-        os.mkdir(args.output_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
     time_ = time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime())
     init_logger(log_file=args.output_dir + f'/{args.model_type}-{args.task_name}-{time_}.log')
+    if args.offline:
+        set_offline_mode(True, args.model_registry)
     if os.path.exists(args.output_dir) and os.listdir(
             args.output_dir) and args.do_train and not args.overwrite_output_dir:
         raise ValueError(
@@ -415,9 +848,18 @@ def main():
         ptvsd.enable_attach(address=(args.server_ip, args.server_port), redirect_output=True)
         ptvsd.wait_for_attach()
     # Setup CUDA, GPU & distributed training
-    if args.local_rank == -1 or args.no_cuda:
+    if args.local_rank == -1:
         device = torch.device("cuda" if torch.cuda.is_available() and not args.no_cuda else "cpu")
         args.n_gpu = torch.cuda.device_count()
+    elif args.no_cuda or not torch.cuda.is_available():
+        # Distributed training on cpu processes, synchronised with gloo
+        device = torch.device("cpu")
+        torch.distributed.init_process_group(backend="gloo")
+        args.n_gpu = 0
+        procs_per_node = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+        torch.set_num_threads(args.threads_per_proc if args.threads_per_proc > 0
+                              else max(1, (os.cpu_count() or 1) // procs_per_node))
+        logger.info("Rank %d uses %d intra-op threads", torch.distributed.get_rank(), torch.get_num_threads())
     else:  # Initializes the distributed backend which will take care of sychronizing nodes/GPUs
         torch.cuda.set_device(args.local_rank)
         device = torch.device("cuda", args.local_rank)
@@ -461,6 +903,8 @@ def main():
     # Training
     if args.do_train:
         train_dataset = load_and_cache_examples(args, args.task_name, tokenizer, data_type='train')
+        if args.auto_batch_size:
+            find_max_batch_size(args, model)
         global_step, tr_loss = train(args, train_dataset, model, tokenizer)
         logger.info(" global_step = %s, average loss = %s", global_step, tr_loss)
     # Saving best-practices: if you use defaults names for the model, you can reload it using from_pretrained()
@@ -490,15 +934,23 @@ def main():
         if args.eval_all_checkpoints:
             checkpoints = list(
                 os.path.dirname(c) for c in sorted(glob.glob(args.output_dir + "/**/" + WEIGHTS_NAME, recursive=True))
+                if not is_best_model_dir(args, os.path.dirname(c))
             )
             logging.getLogger("pytorch_transformers.modeling_utils").setLevel(logging.WARN)  # Reduce logging
         logger.info("Evaluate the following checkpoints: %s", checkpoints)
-        for checkpoint in checkpoints:
+        args.eval_batch_size = args.per_gpu_eval_batch_size * max(1, args.n_gpu)
+        if args.checkpoint_workers > 1 and len(checkpoints) > 1:
+            checkpoint_results = run_checkpoints_in_pool(args, checkpoints, model_class, config, tokenizer,
+                                                         data_type='dev')
+        else:
+            checkpoint_results = []
+            for checkpoint in checkpoints:
+                prefix = checkpoint.split('/')[-1] if checkpoint.find('checkpoint') != -1 else ""
+                model = model_class.from_pretrained(checkpoint, config=config)
+                model.to(args.device)
+                checkpoint_results.append((checkpoint, evaluate(args, model, tokenizer, prefix=prefix)))
+        for checkpoint, result in checkpoint_results:
             global_step = checkpoint.split("-")[-1] if len(checkpoints) > 1 else ""
-            prefix = checkpoint.split('/')[-1] if checkpoint.find('checkpoint') != -1 else ""
-            model = model_class.from_pretrained(checkpoint, config=config)
-            model.to(args.device)
-            result = evaluate(args, model, tokenizer, prefix=prefix)
             if global_step:
                 result = {"{}_{}".format(global_step, k): v for k, v in result.items()}
             results.update(result)
@@ -506,6 +958,16 @@ def main():
         with open(output_eval_file, "w") as writer:
             for key in sorted(results.keys()):
                 writer.write("{} = {}\n".format(key, str(results[key])))
+            leaderboard = sorted(checkpoint_results, key=lambda x: x[1]['f1'], reverse=True)
+            if leaderboard:
+                writer.write("\n***** Leaderboard (dev f1) *****\n")
+            for rank, (checkpoint, result) in enumerate(leaderboard, 1):
+                writer.write("{} {} f1 = {:.4f} acc = {:.4f} recall = {:.4f} loss = {:.4f}\n".format(
+                    rank, checkpoint, result['f1'], result['acc'], result['recall'], result['loss']))
+        if leaderboard:
+            logger.info("Best checkpoint: %s (f1 = %.4f)", leaderboard[0][0], leaderboard[0][1]['f1'])
+        else:
+            logger.warning("No checkpoints found to evaluate in %s", args.output_dir)
 
     if args.do_predict and args.local_rank in [-1, 0]:
         tokenizer = tokenizer_class.from_pretrained(args.output_dir, do_lower_case=args.do_lower_case)
@@ -513,16 +975,20 @@ def main():
         if args.from_checkpoint is not None:
             checkpoints.append(args.from_checkpoint)
         elif args.from_all_checkpoints:
-            checkpoints.extend([os.path.join(args.output_dir, name) for name in os.listdir(args.output_dir) if os.path.isdir(os.path.join(args.output_dir, name))])
+            checkpoints.extend([os.path.join(args.output_dir, name) for name in os.listdir(args.output_dir) if os.path.isdir(os.path.join(args.output_dir, name))
+                                and not is_best_model_dir(args, os.path.join(args.output_dir, name))])
         else:
             checkpoints.append(args.output_dir)
         logger.info("Predict the following checkpoints: %s", checkpoints)
-        for checkpoint in checkpoints:
-            prefix = checkpoint.split('/')[-1] if checkpoint.find('checkpoint') != -1 else ""
-            print(prefix)
-            model = model_class.from_pretrained(checkpoint, config=config)
-            model.to(args.device)
-            predict(args, model, tokenizer, prefix=prefix)
+        if args.checkpoint_workers > 1 and len(checkpoints) > 1:
+            run_checkpoints_in_pool(args, checkpoints, model_class, config, tokenizer, data_type='test')
+        else:
+            for checkpoint in checkpoints:
+                prefix = checkpoint.split('/')[-1] if checkpoint.find('checkpoint') != -1 else ""
+                print(prefix)
+                model = model_class.from_pretrained(checkpoint, config=config)
+                model.to(args.device)
+                predict(args, model, tokenizer, prefix=prefix)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+""" The multi-tensor (foreach=True) steps of AdamW, Lamb and RAdam must update the parameters and the optimizer
+state exactly like the python loop over the parameters. """
+import pytest
+import torch
+from callback.optimizater.adamw import AdamW
+from callback.optimizater.lamb import Lamb
+from callback.optimizater.radam import RAdam
+
+STEPS = 12
+SHAPES = [(7, 5), (5,), (3, 4, 2), (1,), (16,)]
+
+OPTIMIZERS = {
+    'adamw': lambda groups, foreach: AdamW(groups, lr=1e-2, weight_decay=0.01, foreach=foreach),
+    'adamw_no_decay_no_bias_correction':
+        lambda groups, foreach: AdamW(groups, lr=1e-2, weight_decay=0.0, correct_bias=False, foreach=foreach),
+    'lamb': lambda groups, foreach: Lamb(groups, lr=1e-2, weight_decay=0.01, foreach=foreach),
+    'lamb_adam_no_decay': lambda groups, foreach: Lamb(groups, lr=1e-2, weight_decay=0.0, adam=True, foreach=foreach),
+    # with beta2=0.999 the first steps have N_sma < 5 (unrectified update), the later ones are rectified
+    'radam': lambda groups, foreach: RAdam(groups, lr=1e-2, weight_decay=0.01, foreach=foreach),
+    'radam_no_decay': lambda groups, foreach: RAdam(groups, lr=1e-2, weight_decay=0.0, foreach=foreach),
+}
+
+
+def run_steps(make_optimizer, foreach, init_params, grads):
+    params = [torch.nn.Parameter(p.clone()) for p in init_params]
+    # two groups with different learning rates, as in run_ner_crf (bert / crf parameters)
+    optimizer = make_optimizer([{'params': params[:3]}, {'params': params[3:], 'lr': 2e-2}], foreach)
+    for step, step_grads in enumerate(grads):
+        for i, (p, g) in enumerate(zip(params, step_grads)):
+            # the first parameter skips some steps, so the parameters of a group are at different step counts
+            p.grad = None if i == 0 and step % 4 == 1 else g.clone()
+        optimizer.step()
+        yield params, optimizer
+
+
+@pytest.mark.parametrize('name', sorted(OPTIMIZERS))
+def test_foreach_matches_loop(name):
+    torch.manual_seed(0)
+    init_params = [torch.randn(shape) for shape in SHAPES]
+    grads = [[torch.randn(shape) * 0.1 for shape in SHAPES] for _ in range(STEPS)]
+    loop_steps = run_steps(OPTIMIZERS[name], False, init_params, grads)
+    foreach_steps = run_steps(OPTIMIZERS[name], True, init_params, grads)
+    for step, ((loop_params, loop_optimizer), (foreach_params, foreach_optimizer)) in \
+            enumerate(zip(loop_steps, foreach_steps), 1):
+        for i, (a, b) in enumerate(zip(loop_params, foreach_params)):
+            assert torch.allclose(a, b, rtol=1e-5, atol=1e-6), "parameter {} differs after step {}".format(i, step)
+            loop_state, foreach_state = loop_optimizer.state[a], foreach_optimizer.state[b]
+            assert loop_state.keys() == foreach_state.keys()
+            for key, value in loop_state.items():
+                if torch.is_tensor(value):
+                    assert torch.allclose(value, foreach_state[key], rtol=1e-5, atol=1e-6), \
+                        "state {} of parameter {} differs after step {}".format(key, i, step)
+                else:
+                    assert value == foreach_state[key]
@@ -0,0 +1,44 @@
+""" CNerTokenizer.encode_batch must give the ids of convert_tokens_to_ids(tokenize(text)) for every text. """
+import random
+import pytest
+from processors.utils_ner import CNerTokenizer
+
+VOCAB = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '浙', '商', '银', '行', '叶', '老', '桂', 'a', 'b', 'z', '1',
+         '，', '。', ',', '.', '-', 'ß', 'ǆ', 'İ', 'ı', 'ﬁ', '😀', '##a', 'ab', '中国']
+
+TEXTS = [
+    '',
+    '浙商银行叶老桂',
+    'ABZ abz 123',
+    '浙商，银行。叶老桂,.-',
+    'ẞß ǄǅǆDž İıI i ﬁ',  # letters whose lowercase is not a single vocab character (or not what it looks like)
+    '😀 𠀀 ​﻿\U0010ffff',  # characters outside the BMP and unassigned / zero width ones
+    '中国ab##a',
+]
+
+
+@pytest.fixture(params=[False, True], ids=['cased', 'lower'])
+def tokenizer(request, tmp_path):
+    vocab_file = tmp_path / 'vocab.txt'
+    vocab_file.write_text('\n'.join(VOCAB) + '\n', encoding='utf-8')
+    return CNerTokenizer(vocab_file, do_lower_case=request.param)
+
+
+def per_token_ids(tokenizer, text):
+    return tokenizer.convert_tokens_to_ids(tokenizer.tokenize(text))
+
+
+def test_encode_batch_matches_tokenize(tokenizer):
+    random.seed(0)
+    alphabet = ''.join(VOCAB[5:]) + 'ABZẞǄǅİ∑Ω\U0001f600'
+    texts = TEXTS + [''.join(random.choice(alphabet) for _ in range(random.randint(0, 40))) for _ in range(200)]
+    for text, ids in zip(texts, tokenizer.encode_batch(texts)):
+        assert ids.tolist() == per_token_ids(tokenizer, text), text
+
+
+def test_encode_batch_of_character_lists(tokenizer):
+    # InputExample.text_a is a list of characters, lists of words are looked up word by word like tokenize does
+    texts = [list(text) for text in TEXTS] + [['中国', 'a', 'b'], ['ab', '浙']]
+    for text, ids in zip(texts, tokenizer.encode_batch(texts)):
+        assert ids.tolist() == per_token_ids(tokenizer, text), text
+
@@ -0,0 +1,68 @@
+""" Benchmark of the start-up cost of models.transformers: lazy (default) vs eager (TRANSFORMERS_EAGER_IMPORT=1).
+Every statement is timed in a fresh interpreter, the median wall time over --repeats runs is reported.
+With --importtime the `python -X importtime` report of the slowest modules is printed for each statement.
+Example usage (from the repository root):
+  python -m tools.benchmark_import_time --repeats 5 --importtime
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+STATEMENTS = [
+    "import models.transformers",
+    "from models.transformers import BertConfig, BertTokenizer",
+    "import models.bert_for_ner",
+]
+
+
+def run(statement, eager, importtime=False):
+    env = dict(os.environ, TRANSFORMERS_EAGER_IMPORT="1" if eager else "0")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", statement]
+    start = time.time()
+    result = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    elapsed = time.time() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"`{statement}` failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def slowest_modules(report, top):
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument("--importtime", action="store_true", help="print the slowest modules of each statement")
+    parser.add_argument("--top", default=10, type=int)
+    args = parser.parse_args()
+    print(f"{'statement':>60} {'lazy ms':>9} {'eager ms':>9} {'speedup':>8}")
+    for statement in STATEMENTS:
+        lazy = median([run(statement, False)[0] for _ in range(args.repeats)])
+        eager = median([run(statement, True)[0] for _ in range(args.repeats)])
+        print(f"{statement:>60} {lazy * 1e3:>9.1f} {eager * 1e3:>9.1f} {eager / lazy:>7.2f}x")
+    if args.importtime:
+        for statement in STATEMENTS:
+            for eager in (False, True):
+                _, report = run(statement, eager, importtime=True)
+                print(f"\n{statement} ({'eager' if eager else 'lazy'}), cumulative us:")
+                for cumulative, name in slowest_modules(report, args.top):
+                    print(f"{cumulative:>12} {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+""" Micro-benchmark of the optimizer step: python loop over the parameters vs multi-tensor (foreach) kernels.
+The parameter shapes follow a BERT encoder (chinese_roberta_wwm_large by default), both variants are run on the
+same gradients and the largest difference of the resulting parameters is reported. The equivalence of the two
+variants is tested in tests/test_optimizers.py.
+Example usage (from the repository root):
+  python -m tools.benchmark_optimizers --num_layers 24 --hidden_size 1024 --steps 20
+"""
+import time
+import argparse
+import torch
+from callback.optimizater.adamw import AdamW
+from callback.optimizater.lamb import Lamb
+from callback.optimizater.radam import RAdam
+
+OPTIMIZERS = {
+    'adamw': lambda params, foreach: AdamW(params, lr=1e-3, weight_decay=0.01, foreach=foreach),
+    'lamb': lambda params, foreach: Lamb(params, lr=1e-3, weight_decay=0.01, foreach=foreach),
+    'radam': lambda params, foreach: RAdam(params, lr=1e-3, weight_decay=0.01, foreach=foreach),
+}
+
+
+def bert_shapes(num_layers, hidden_size, vocab_size=21128):
+    shapes = [(vocab_size, hidden_size), (512, hidden_size), (2, hidden_size), (hidden_size,), (hidden_size,)]
+    for _ in range(num_layers):
+        for _ in range(4):  # query, key, value, attention output
+            shapes += [(hidden_size, hidden_size), (hidden_size,)]
+        shapes += [(hidden_size,), (hidden_size,)]
+        shapes += [(4 * hidden_size, hidden_size), (4 * hidden_size,), (hidden_size, 4 * hidden_size), (hidden_size,)]
+        shapes += [(hidden_size,), (hidden_size,)]
+    return shapes
+
+
+def run(name, foreach, init_params, grads, device):
+    params = [torch.nn.Parameter(p.clone()) for p in init_params]
+    optimizer = OPTIMIZERS[name](params, foreach)
+    elapsed = 0.0
+    for step_grads in grads:
+        for p, g in zip(params, step_grads):
+            p.grad = g
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.time()
+        optimizer.step()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        elapsed += time.time() - start
+    return params, elapsed / len(grads)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--optimizers", default="adamw,lamb,radam", type=str)
+    parser.add_argument("--num_layers", default=24, type=int)
+    parser.add_argument("--hidden_size", default=1024, type=int)
+    parser.add_argument("--steps", default=10, type=int)
+    parser.add_argument("--no_cuda", action="store_true")
+    args = parser.parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() and not args.no_cuda else "cpu")
+
+    torch.manual_seed(42)
+    shapes = bert_shapes(args.num_layers, args.hidden_size)
+    init_params = [torch.randn(shape, device=device) * 0.02 for shape in shapes]
+    grads = [[torch.randn(shape, device=device) * 1e-3 for shape in shapes] for _ in range(args.steps)]
+    print(f"{len(shapes)} parameter tensors, {sum(p.numel() for p in init_params) / 1e6:.1f}M parameters on {device}")
+    print(f"{'optimizer':>10} {'loop ms/step':>14} {'foreach ms/step':>16} {'speedup':>8} {'max abs diff':>13}")
+    for name in args.optimizers.split(','):
+        loop_params, loop_time = run(name, False, init_params, grads, device)
+        foreach_params, foreach_time = run(name, True, init_params, grads, device)
+        max_diff = max((a - b).abs().max().item() for a, b in zip(loop_params, foreach_params))
+        print(f"{name:>10} {loop_time * 1e3:>14.2f} {foreach_time * 1e3:>16.2f} "
+              f"{loop_time / foreach_time:>7.2f}x {max_diff:>13.2e}")
+
+
+if __name__ == "__main__":
+    main()
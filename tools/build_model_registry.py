@@ -0,0 +1,66 @@
+"""Build (or extend) a local model registry from the transformers download cache.
+
+Run on a machine with network access after the models have been loaded once, then copy the registry to the
+offline machines and set TRANSFORMERS_OFFLINE=1 and TRANSFORMERS_MODEL_REGISTRY=<registry_dir>.
+Every cached file with a metadata file is copied to <registry_dir>/<url host>/<url path> and listed in
+<registry_dir>/manifest.json, which maps the original url to that relative path.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import shutil
+import argparse
+from io import open
+from models.transformers import TRANSFORMERS_CACHE
+from models.transformers.file_utils import REGISTRY_MANIFEST_NAME, urlparse
+
+
+def build_model_registry(registry_dir, cache_dir=None):
+    cache_dir = str(cache_dir or TRANSFORMERS_CACHE)
+    manifest_path = os.path.join(registry_dir, REGISTRY_MANIFEST_NAME)
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+
+    for meta_name in sorted(os.listdir(cache_dir)):
+        cache_path = os.path.join(cache_dir, meta_name[:-len('.json')])
+        if not meta_name.endswith('.json') or not os.path.isfile(cache_path):
+            continue
+        with open(os.path.join(cache_dir, meta_name), encoding="utf-8") as meta_file:
+            url = json.load(meta_file)['url']
+        parsed = urlparse(url)
+        relative_path = os.path.join(parsed.netloc, parsed.path.lstrip('/'))
+        registry_path = os.path.join(registry_dir, relative_path)
+        os.makedirs(os.path.dirname(registry_path), exist_ok=True)
+        shutil.copyfile(cache_path, registry_path)
+        manifest[url] = relative_path
+        print("Registered {} as {}".format(url, relative_path))
+
+    with open(manifest_path, 'w', encoding="utf-8") as manifest_file:
+        manifest_file.write(json.dumps(manifest, indent=2, sort_keys=True))
+    print("Saved {} entries to {}".format(len(manifest), manifest_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("--registry_dir",
+                        default = None,
+                        type = str,
+                        required = True,
+                        help = "Directory of the model registry, created if needed.")
+    parser.add_argument("--cache_dir",
+                        default = None,
+                        type = str,
+                        help = "Download cache to read from, default: the transformers cache.")
+    args = parser.parse_args()
+    build_model_registry(args.registry_dir, args.cache_dir)
+
+'''
+python -m tools.build_model_registry --registry_dir=/data/model_registry
+'''
@@ -58,6 +58,30 @@ def seed_everything(seed=1029):
     torch.backends.cudnn.deterministic = True
 
 
+def get_rng_state():
+    '''
+    获取python/numpy/torch的随机数状态，与checkpoint一起保存，用于断点续训
+    :return:
+    '''
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    '''
+    恢复get_rng_state()保存的随机数状态
+    :param state:
+    :return:
+    '''
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
 def prepare_device(n_gpu_use):
     """
     setup GPU device if available, move model into configured device
@@ -277,6 +301,40 @@ class AverageMeter(object):
         self.avg = self.sum / self.count
 
 
+class DeviceAverageMeter(object):
+    '''
+    computes the running sum and average of scalar tensors on their own device,
+    the value is only copied to the host (which synchronises the device) when `sum`/`avg` is read
+    Example:
+        >>> loss = DeviceAverageMeter()
+        >>> for step,batch in enumerate(train_data):
+        >>>     raw_loss = self.model(batch)[0]
+        >>>     loss.update(raw_loss)
+        >>>     if step % logging_steps == 0:
+        >>>         cur_loss = loss.avg
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._sum = None
+        self.count = 0
+
+    def update(self, val, n=1):
+        val = val.detach() * n
+        self._sum = val if self._sum is None else self._sum + val
+        self.count += n
+
+    @property
+    def sum(self):
+        return 0.0 if self._sum is None else self._sum.item()
+
+    @property
+    def avg(self):
+        return self.sum / max(1, self.count)
+
+
 def summary(model, *inputs, batch_size=-1, show_input=True):
     '''
     打印模型结构信息
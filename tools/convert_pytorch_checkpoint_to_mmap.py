@@ -0,0 +1,57 @@
+"""Convert a PyTorch checkpoint (pytorch_model.bin) to the memory-mapped weights format (pytorch_model.mmap).
+
+`PreTrainedModel.from_pretrained(..., use_mmap=True)` loads `pytorch_model.mmap` when a model directory contains
+one that is not older than its `pytorch_model.bin`: the file is mapped in memory instead of unpickled and its
+tensors are used as the parameters without copy.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import torch
+from models.transformers import WEIGHTS_NAME, MMAP_WEIGHTS_NAME
+from models.transformers.modeling_utils import save_mmap_state_dict, load_mmap_state_dict
+import logging
+logging.basicConfig(level=logging.INFO)
+
+
+def convert_pytorch_checkpoint_to_mmap(pytorch_model_path, mmap_dump_path=None):
+    if os.path.isdir(pytorch_model_path):
+        pytorch_model_path = os.path.join(pytorch_model_path, WEIGHTS_NAME)
+    if mmap_dump_path is None:
+        mmap_dump_path = os.path.join(os.path.dirname(pytorch_model_path), MMAP_WEIGHTS_NAME)
+    state_dict = torch.load(pytorch_model_path, map_location='cpu')
+    print("Save {} tensors to {}".format(len(state_dict), mmap_dump_path))
+    save_mmap_state_dict(state_dict, mmap_dump_path)
+
+    # check the round trip
+    start = time.time()
+    mapped = load_mmap_state_dict(mmap_dump_path)
+    print("Mapped {} in {:.3f}s".format(mmap_dump_path, time.time() - start))
+    assert list(mapped.keys()) == list(state_dict.keys())
+    for name, tensor in state_dict.items():
+        assert torch.equal(mapped[name], tensor), name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("--pytorch_model_path",
+                        default = None,
+                        type = str,
+                        required = True,
+                        help = "Path to the pytorch_model.bin file or to the model directory.")
+    parser.add_argument("--mmap_dump_path",
+                        default = None,
+                        type = str,
+                        help = "Path to the output file, default: pytorch_model.mmap next to the input.")
+    args = parser.parse_args()
+    convert_pytorch_checkpoint_to_mmap(args.pytorch_model_path, args.mmap_dump_path)
+
+'''
+python -m tools.convert_pytorch_checkpoint_to_mmap --pytorch_model_path=./prev_trained_model/chinese_roberta_wwm_large
+'''
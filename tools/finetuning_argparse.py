@@ -26,6 +26,10 @@ def get_argparse():
                         help="Pretrained tokenizer name or path if not the same as model_name", )
     parser.add_argument("--cache_dir", default="", type=str,
                         help="Where do you want to store the pre-trained models downloaded from s3", )
+    parser.add_argument("--offline", action="store_true",
+                        help="Never download, resolve pre-trained model urls against --model_registry and --cache_dir", )
+    parser.add_argument("--model_registry", default=None, type=str,
+                        help="Local model registry directory (with a manifest.json) used in offline mode", )
     parser.add_argument("--train_max_seq_length", default=128, type=int,
                         help="The maximum total input sequence length after tokenization. Sequences longer "
                              "than this will be truncated, sequences shorter will be padded.", )
@@ -54,8 +58,23 @@ def get_argparse():
                         help="Batch size per GPU/CPU for training.")
     parser.add_argument("--per_gpu_eval_batch_size", default=8, type=int,
                         help="Batch size per GPU/CPU for evaluation.")
+    parser.add_argument("--dataloader_num_workers", type=int, default=0,
+                        help="Number of worker processes used to load and collate the batches (0 loads them in the main process).")
     parser.add_argument("--gradient_accumulation_steps", type=int, default=1,
                         help="Number of updates steps to accumulate before performing a backward/update pass.", )
+    parser.add_argument("--auto_batch_size", action="store_true",
+                        help="Probe the largest per-gpu train batch that fits in memory at train_max_seq_length and "
+                             "adjust --gradient_accumulation_steps to keep the effective batch size.")
+    parser.add_argument("--auto_batch_size_memory_fraction", type=float, default=0.9,
+                        help="Fraction of the device memory that --auto_batch_size may use.")
+    parser.add_argument("--max_auto_batch_size", type=int, default=512,
+                        help="Largest batch size probed by --auto_batch_size.")
+    parser.add_argument("--target_batch_size", type=int, default=0,
+                        help="If > 0: set --gradient_accumulation_steps so that batch size x accumulation x processes reaches X.")
+    parser.add_argument("--lr_scaling", default='none', type=str, choices=['none', 'linear', 'sqrt'],
+                        help="Scale the learning rates and the warmup from --reference_batch_size to the effective batch size.")
+    parser.add_argument("--reference_batch_size", type=int, default=112,
+                        help="Batch size the learning rates were tuned for, used by --lr_scaling.")
     parser.add_argument("--learning_rate", default=5e-5, type=float,
                         help="The initial learning rate for Adam.")
     parser.add_argument("--crf_learning_rate", default=5e-5, type=float,
@@ -64,6 +83,19 @@ def get_argparse():
                         help="Weight decay if we apply some.")
     parser.add_argument("--adam_epsilon", default=1e-8, type=float,
                         help="Epsilon for Adam optimizer.")
+    parser.add_argument("--optimizer", default='adamw', type=str,
+                        choices=['adamw', 'adafactor', 'adamw8bit', 'lamb', 'lars', 'radam'],
+                        help="adamw: fp32 moments, adafactor: factored second moments, adamw8bit: blockwise 8-bit moments, "
+                             "lamb/lars: layer-wise trust ratios for large-batch training, radam: rectified adam.")
+    parser.add_argument("--lars_momentum", default=0.9, type=float,
+                        help="Momentum of the LARS optimizer.")
+    parser.add_argument("--adafactor_beta1", default=0.0, type=float,
+                        help="First moment decay of Adafactor, 0 disables the first moment to save memory.")
+    parser.add_argument("--optim_block_size", default=2048, type=int,
+                        help="Number of values sharing one absmax scale in the 8-bit optimizer states.")
+    parser.add_argument("--foreach_optimizer", action="store_true",
+                        help="Update the parameters with multi-tensor (torch._foreach_*) kernels instead of a python loop "
+                             "(adamw, lamb and radam).")
     parser.add_argument("--max_grad_norm", default=1.0, type=float,
                         help="Max gradient norm.")
     parser.add_argument("--num_train_epochs", default=3.0, type=float,
@@ -75,7 +107,13 @@ def get_argparse():
                         help="Proportion of training to perform linear learning rate warmup for,E.g., 0.1 = 10% of training.")
     parser.add_argument("--logging_steps", type=int, default=50,
                         help="Log every X updates steps.")
+    parser.add_argument("--progress_bar_refresh_steps", type=int, default=1,
+                        help="Redraw the progress bar (and copy the running loss to the host) every X steps.")
     parser.add_argument("--save_steps", type=int, default=50, help="Save checkpoint every X updates steps.")
+    parser.add_argument("--keep_last_checkpoints", type=int, default=0,
+                        help="Keep only the last X checkpoints (together with --keep_best_checkpoints, 0 keeps all).")
+    parser.add_argument("--keep_best_checkpoints", type=int, default=0,
+                        help="Keep only the X checkpoints with the best dev f1 (together with --keep_last_checkpoints, 0 keeps all).")
     parser.add_argument("--eval_all_checkpoints", action="store_true",
                         help="Evaluate all checkpoints starting with the same prefix as model_name ending and ending with step number", )
     parser.add_argument("--predict_checkpoints",type=int, default=0,
@@ -84,6 +122,23 @@ def get_argparse():
                         help="predict from the given checkpoint ")
     parser.add_argument("--from_all_checkpoints", action="store_true",
                         help="predict from all the checkpoint in the output dir")
+    parser.add_argument("--checkpoint_workers", type=int, default=0,
+                        help="Evaluate/predict the checkpoints selected by --eval_all_checkpoints or "
+                             "--from_all_checkpoints in a pool of this many processes (<= 1 runs them serially)")
+    parser.add_argument("--save_best_model", action="store_true",
+                        help="Keep the weights with the best dev f1 (evaluated every --logging_steps) in output_dir/best_model "
+                             "and save them as the final model. Not supported in distributed training.")
+    parser.add_argument("--early_stopping_patience", type=int, default=0,
+                        help="If > 0: stop training after X evaluations without dev f1 improvement (implies --save_best_model).")
+    parser.add_argument("--early_stopping_min_delta", type=float, default=0.0,
+                        help="Minimum dev f1 increase that counts as an improvement for early stopping.")
+    parser.add_argument("--plot_metrics", action="store_true",
+                        help="Plot the metrics of output_dir/train_metrics.jsonl (needs matplotlib) after training.")
+    parser.add_argument("--profile_steps", type=str, default="",
+                        help="A:B, profile the steps A to B-1 of the first train/evaluate/predict loop with torch.profiler "
+                             "and save a chrome trace and a table of the top ops into output_dir (one per rank under "
+                             "DDP). The \"collate\" range of collate_fn is only recorded when the DataLoader has "
+                             "num_workers=0, worker processes are not profiled.")
     parser.add_argument("--no_cuda", action="store_true", help="Avoid using CUDA when available")
     parser.add_argument("--overwrite_output_dir", action="store_true",
                         help="Overwrite the content of the output directory")
@@ -95,6 +150,15 @@ def get_argparse():
     parser.add_argument("--fp16_opt_level", type=str, default="O1",
                         help="For fp16: Apex AMP optimization level selected in ['O0', 'O1', 'O2', and 'O3']."
                              "See details at https://nvidia.github.io/apex/amp.html", )
+    parser.add_argument("--num_cpu_procs", type=int, default=0,
+                        help="Train with DistributedDataParallel over X cpu processes on this machine (gloo backend).")
+    parser.add_argument("--threads_per_proc", type=int, default=0,
+                        help="Intra-op threads of each cpu process in distributed training (0: cpu count / processes per node).")
+    parser.add_argument("--ddp_bucket_cap_mb", type=int, default=25,
+                        help="Size in MB of the gradient buckets that DistributedDataParallel all-reduces together.")
+    parser.add_argument("--ddp_find_unused_parameters", action="store_true",
+                        help="Let DistributedDataParallel search for unused parameters on every step. By default "
+                             "the search is only enabled when some parameters get no gradient on the first batch.")
     parser.add_argument("--local_rank", type=int, default=-1, help="For distributed training: local_rank")
     parser.add_argument("--server_ip", type=str, default="", help="For distant debugging.")
     parser.add_argument("--server_port", type=str, default="", help="For distant debugging.")
@@ -0,0 +1,70 @@
+import os
+import torch
+from tools.common import logger
+
+# stages that have already been profiled in this process, only the first train/evaluate/predict call is traced
+_profiled_stages = set()
+
+
+class StepProfiler(object):
+    '''
+    用torch.profiler记录第[A, B)个step，结束后在output_dir下导出chrome trace和耗时最多的算子表
+    Example:
+        >>> profiler = StepProfiler(args.profile_steps, args.output_dir, 'train')
+        >>> for step, batch in enumerate(dataloader):
+        >>>     profiler.step(step)
+        >>>     ...
+        >>> profiler.stop()
+    '''
+    # the profiler that is currently recording, torch.profiler can not be nested (e.g. evaluate inside train)
+    _active = None
+
+    def __init__(self, profile_steps, output_dir, stage, row_limit=30):
+        self.output_dir = output_dir
+        self.stage = stage
+        self.row_limit = row_limit
+        self.enabled = bool(profile_steps) and stage not in _profiled_stages
+        self.prof = None
+        if self.enabled:
+            start, end = profile_steps.split(':')
+            self.start, self.end = int(start), int(end)
+            if not 0 <= self.start < self.end:
+                raise ValueError("Invalid --profile_steps {}, expected A:B with 0 <= A < B".format(profile_steps))
+
+    def step(self, step):
+        '''
+        在每个step开始时调用
+        '''
+        if not self.enabled:
+            return
+        if self.prof is None and StepProfiler._active is None and self.start <= step < self.end:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.prof = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+            self.prof.__enter__()
+            StepProfiler._active = self
+            logger.info("Profiling %s steps %d to %d", self.stage, step, self.end - 1)
+        elif self.prof is not None and step >= self.end:
+            self.stop()
+
+    def stop(self):
+        if self.prof is None:
+            return
+        self.prof.__exit__(None, None, None)
+        StepProfiler._active = None
+        _profiled_stages.add(self.stage)
+        self.enabled = False
+        # under DDP every rank profiles its own steps, keep their files apart
+        suffix = ""
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            suffix = "_rank{}".format(torch.distributed.get_rank())
+        trace_file = os.path.join(self.output_dir, "profile_{}{}_trace.json".format(self.stage, suffix))
+        self.prof.export_chrome_trace(trace_file)
+        sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+        table = self.prof.key_averages().table(sort_by=sort_by, row_limit=self.row_limit)
+        table_file = os.path.join(self.output_dir, "profile_{}{}_top_ops.txt".format(self.stage, suffix))
+        with open(table_file, 'w') as writer:
+            writer.write(table)
+        logger.info("Saving %s profile to %s and %s", self.stage, trace_file, table_file)
+        self.prof = None
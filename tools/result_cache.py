@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+try:
+    import fcntl
+except ImportError:
+    # no file locks (windows): concurrent merging saves may lose the entries of one of the processes
+    fcntl = None
+from collections import OrderedDict
+from tools.common import save_pickle, load_pickle, logger
+
+
+class ResultCache(object):
+    '''
+    线程安全的LRU缓存，可选TTL(秒)，统计命中率，可以保存到文件并在重启后加载
+    Example:
+        >>> cache = ResultCache(max_size=100000, ttl=3600, name='entities')
+        >>> entities = cache.get(key)
+        >>> if entities is None:
+        >>>     entities = compute(text)
+        >>>     cache.put(key, entities)
+        >>> logger.info(cache.stats())
+    '''
+    def __init__(self, max_size=100000, ttl=None, name='cache'):
+        if max_size <= 0:
+            raise ValueError("Invalid cache size: {} - should be > 0".format(max_size))
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        # key -> (expire time or None, value), the least recently used entry first
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        # wall clock expiry, so that the entries of a saved cache expire across restarts too
+        expire_time = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expire_time, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def save(self, file_path, merge=False):
+        '''
+        保存未过期的条目，先写临时文件再替换，保存中途退出不会留下损坏的文件
+        merge=True 时和文件中已有的条目合并(同一个key以本缓存的为准)，用于多个进程保存到同一个文件，
+        用 file_path.lock 文件锁串行化这些进程的读取-合并-替换
+        '''
+        now = time.time()
+        with self._lock:
+            entries = [(key, entry) for key, entry in self._entries.items() if entry[0] is None or entry[0] >= now]
+        lock_file = None
+        if merge and fcntl is not None:
+            lock_file = open(file_path + '.lock', 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if merge and os.path.isfile(file_path):
+                keys = set(key for key, _ in entries)
+                # the entries of the other processes are treated as less recently used than our own
+                merged = [(key, entry) for key, entry in load_pickle(file_path)
+                          if key not in keys and (entry[0] is None or entry[0] >= now)]
+                entries = (merged + entries)[-self.max_size:]
+            tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+            save_pickle(entries, tmp_path)
+            os.replace(tmp_path, file_path)
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+        logger.info("Saved %d entries of the %s cache to %s", len(entries), self.name, file_path)
+
+    def load(self, file_path):
+        '''
+        加载save保存的条目，跳过已过期的，超过max_size时保留最近使用的
+        '''
+        now = time.time()
+        entries = [(key, entry) for key, entry in load_pickle(file_path) if entry[0] is None or entry[0] >= now]
+        with self._lock:
+            for key, entry in entries[-self.max_size:]:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        logger.info("Loaded %d entries of the %s cache from %s", len(entries), self.name, file_path)